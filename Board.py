@@ -3,11 +3,12 @@ import os
 import sys
 sys.path.append('/home/pi/MasterPi/')
 import time
-import yaml_handle
-import RPi.GPIO as GPIO
-from smbus2 import SMBus, i2c_msg
-from rpi_ws281x import PixelStrip
-from rpi_ws281x import Color as PixelColor
+import atexit
+import threading
+try:
+    import HiwonderSDK.busservo as busservo
+except ImportError:  # 不在树莓派上时使用同目录下的 busservo.py
+    import busservo
 
 #幻尔科技raspberrypi扩展板sdk#
 if sys.version_info.major == 2:
@@ -25,8 +26,40 @@ __servo_pulse = [0, 0, 0, 0, 0, 0]
 __i2c = 1
 __i2c_addr = 0x7A
 
-GPIO.setwarnings(False)
-GPIO.setmode(GPIO.BOARD)
+# 寄存器读写后端(默认 I2CBackend)，所有寄存器读写共用
+__board = None
+__bus_lock = threading.RLock()
+
+# 影子寄存器: 记录总线最后一次确认写入的值, 相同的值不再重复写(None表示未知, 必须写)
+__motor_ack = [None, None, None, None]
+__servo_ack = [None, None, None, None, None, None]
+__bus_stats = {'sent': 0, 'suppressed': 0}
+
+# 耗时统计回调 probe(阶段名, 秒), None 时不计时
+__probe = None
+__PROBE_STAGES = {__MOTOR_ADDR: 'bus_motor', __SERVO_ADDR_CMD: 'bus_servo', __ADC_BAT_ADDR: 'bus_battery'}
+
+# 舵机偏差表缓存, 只有偏差文件的修改时间变化时才重新读取
+__deviation_data = None
+__deviation_mtime = None
+
+# 硬件后端, 没有指定的在第一次使用时导入真实硬件的库
+# 'board': 寄存器读写后端(有 write/read/close 的对象, 如 sim.SimBoard), 没有时用 I2CBackend
+# 'i2c': SMBus, 'i2c_msg': smbus2.i2c_msg, 'gpio': RPi.GPIO, 'rgb': PixelStrip,
+# 'color': rpi_ws281x.Color, 'yaml': yaml_handle, 'servo_serial': serial.Serial(总线舵机串口)
+__backends = {}
+__gpio = None
+__rgb = None
+__BUZZER_PIN = 31
+
+# 总线舵机: 串口和半双工方向控制引脚, 每个读请求的等待时间(秒)和超时后的重发次数
+__servo_bus = None
+__servo_lock = threading.RLock()
+__SERVO_SERIAL_PORT = '/dev/ttyAMA0'
+__SERVO_RX_PIN = 7
+__SERVO_TX_PIN = 13
+__BUS_SERVO_TIMEOUT = 0.05
+__BUS_SERVO_RETRIES = 2
 
 __RGB_COUNT = 2
 __RGB_PIN = 12
@@ -35,13 +68,231 @@ __RGB_DMA = 10
 __RGB_BRIGHTNESS = 120
 __RGB_CHANNEL = 0
 __RGB_INVERT = False
-RGB = PixelStrip(__RGB_COUNT, __RGB_PIN, __RGB_FREQ_HZ, __RGB_DMA, __RGB_INVERT, __RGB_BRIGHTNESS, __RGB_CHANNEL)
-RGB.begin()
-for i in range(RGB.numPixels()):
-    RGB.setPixelColor(i, PixelColor(0,0,0))
-    RGB.show()
 
-def setMotor(index, speed):
+def init(backends=None):
+    """
+    选择硬件后端. 导入本模块时不会初始化任何硬件, 各外设在第一次使用时才初始化
+    不调用 init() 时使用真实硬件
+    :param backends: dict, 键为 'board' 'i2c' 'i2c_msg' 'gpio' 'rgb' 'color' 'yaml' 'servo_serial',
+                     没有给出的使用真实硬件; 可以传入 sim.backends() 在普通Linux上运行
+    """
+    global __gpio, __rgb, __deviation_data, __deviation_mtime
+    with __bus_lock:
+        closeBus()
+        closeBusServo()
+        __backends.clear()
+        if backends:
+            __backends.update(backends)
+        __gpio = None
+        __rgb = None
+        __deviation_data = None
+        __deviation_mtime = None
+        __motor_ack[:] = [None] * len(__motor_ack)
+        __servo_ack[:] = [None] * len(__servo_ack)
+
+def __load_backend(name):
+    if name == 'i2c':
+        from smbus2 import SMBus
+        return SMBus
+    if name == 'i2c_msg':
+        from smbus2 import i2c_msg
+        return i2c_msg
+    if name == 'gpio':
+        import RPi.GPIO as GPIO
+        return GPIO
+    if name == 'rgb':
+        from rpi_ws281x import PixelStrip
+        return PixelStrip
+    if name == 'color':
+        from rpi_ws281x import Color
+        return Color
+    if name == 'yaml':
+        import yaml_handle
+        return yaml_handle
+    if name == 'servo_serial':
+        from serial import Serial
+        return Serial
+    raise AttributeError("Invalid backend: %s"%name)
+
+def __backend(name):
+    backend = __backends.get(name)
+    if backend is None:
+        backend = __backends[name] = __load_backend(name)
+    return backend
+
+def __get_gpio():
+    global __gpio
+    if __gpio is None:
+        GPIO = __backend('gpio')
+        GPIO.setwarnings(False)
+        GPIO.setmode(GPIO.BOARD)
+        GPIO.setup(__BUZZER_PIN, GPIO.OUT)
+        GPIO.output(__BUZZER_PIN, 0)
+        __gpio = GPIO
+    return __gpio
+
+def __get_rgb():
+    global __rgb
+    if __rgb is None:
+        __get_gpio()
+        rgb = __backend('rgb')(__RGB_COUNT, __RGB_PIN, __RGB_FREQ_HZ, __RGB_DMA, __RGB_INVERT, __RGB_BRIGHTNESS, __RGB_CHANNEL)
+        rgb.begin()
+        color = __backend('color')
+        for i in range(rgb.numPixels()):
+            rgb.setPixelColor(i, color(0,0,0))
+        rgb.show()
+        __rgb = rgb
+    return __rgb
+
+def __getattr__(name):
+    # RGB 和 PixelColor 在第一次访问时才初始化
+    if name == 'RGB':
+        return __get_rgb()
+    if name == 'PixelColor':
+        return __backend('color')
+    raise AttributeError("module %r has no attribute %r"%(__name__, name))
+
+class I2CBackend:
+    """
+    扩展板寄存器读写(真实硬件): 电机寄存器 31~34, PWM舵机命令 40, 电池ADC 0
+    使用常驻的I2C总线句柄, 避免每次读写都open/close /dev/i2c-1; 出错时重新打开总线再重试一次
+    其他后端(如 sim.SimBoard)只需要实现同样的 write/read/close
+    """
+    def __init__(self, bus_factory, msg, bus=1, addr=0x7A):
+        self.bus_factory = bus_factory
+        self.msg = msg
+        self.bus_num = bus
+        self.addr = addr
+        self._bus = None
+        self._lock = threading.RLock()
+
+    def _transfer(self, msgs):
+        with self._lock:
+            try:
+                if self._bus is None:
+                    self._bus = self.bus_factory(self.bus_num)
+                for msg in msgs:
+                    self._bus.i2c_rdwr(msg)
+            except:
+                self.close()
+                self._bus = self.bus_factory(self.bus_num)
+                for msg in msgs:
+                    self._bus.i2c_rdwr(msg)
+
+    def write(self, reg, data):
+        """从寄存器 reg 开始连续写入 data(字节列表)"""
+        self._transfer([self.msg.write(self.addr, [reg] + list(data))])
+
+    def read(self, reg, length):
+        """从寄存器 reg 开始读取 length 个字节"""
+        read = self.msg.read(self.addr, length)
+        self._transfer([self.msg.write(self.addr, [reg]), read])
+        return bytes(list(read))
+
+    def close(self):
+        with self._lock:
+            if self._bus is not None:
+                try:
+                    self._bus.close()
+                except:
+                    pass
+                self._bus = None
+
+def setBusFactory(factory):
+    """
+    使用 I2CBackend 并替换I2C总线的创建方式, 可以传入假总线用于在普通Linux上测试/测速
+    :param factory: 可调用对象, factory(bus_num) 返回带 i2c_rdwr()/close() 的总线对象
+    """
+    with __bus_lock:
+        closeBus()
+        __backends.pop('board', None)
+        __backends['i2c'] = factory
+
+def closeBus():
+    """关闭寄存器读写后端(常驻的I2C总线句柄), 下次读写时会重新打开"""
+    global __board
+    with __bus_lock:
+        if __board is not None:
+            __board.close()
+            __board = None
+
+def __get_board():
+    global __board
+    if __board is None:
+        board = __backends.get('board')
+        if board is None:
+            board = I2CBackend(__backend('i2c'), __backend('i2c_msg'), __i2c, __i2c_addr)
+        __board = board
+    return __board
+
+def __write(reg, data):
+    probe = __probe
+    if probe is not None:
+        start = time.perf_counter()
+    with __bus_lock:
+        __get_board().write(reg, data)
+        __bus_stats['sent'] += 1
+    if probe is not None:
+        probe(__PROBE_STAGES.get(reg, 'bus_write'), time.perf_counter() - start)
+
+def __read(reg, length):
+    probe = __probe
+    if probe is not None:
+        start = time.perf_counter()
+    with __bus_lock:
+        data = __get_board().read(reg, length)
+        __bus_stats['sent'] += 1
+    if probe is not None:
+        probe(__PROBE_STAGES.get(reg, 'bus_read'), time.perf_counter() - start)
+    return data
+
+atexit.register(closeBus)
+
+def getBusStats():
+    """
+    获取总线传输统计
+    :return: {'sent': 实际发送的传输数, 'suppressed': 因数值未变化而省略的写入数}
+    """
+    return dict(__bus_stats)
+
+def setProbe(probe):
+    """
+    设置总线耗时统计回调, 每次寄存器读写后调用 probe(阶段名, 秒)
+    阶段名: 'bus_motor' 'bus_servo' 'bus_battery', 其他寄存器为 'bus_write' / 'bus_read'
+    :param probe: 如 metrics.StageStats().record, None 时关闭
+    """
+    global __probe
+    __probe = probe
+
+def resetBusStats():
+    """清零总线传输统计"""
+    __bus_stats['sent'] = 0
+    __bus_stats['suppressed'] = 0
+
+def reloadDeviation():
+    """
+    重新读取舵机偏差文件
+    :return: 偏差表
+    """
+    global __deviation_data, __deviation_mtime
+    yaml_handle = __backend('yaml')
+    try:
+        __deviation_mtime = os.stat(yaml_handle.Deviation_file_path).st_mtime
+    except OSError:
+        __deviation_mtime = None
+    __deviation_data = yaml_handle.get_yaml_data(yaml_handle.Deviation_file_path)
+    return __deviation_data
+
+def __get_deviation():
+    try:
+        mtime = os.stat(__backend('yaml').Deviation_file_path).st_mtime
+    except OSError:
+        mtime = None
+    if __deviation_data is None or mtime != __deviation_mtime:
+        return reloadDeviation()
+    return __deviation_data
+
+def setMotor(index, speed, force=False):
     if index < 1 or index > 4:
         raise AttributeError("Invalid motor num: %d"%index)
     if index == 2 or index == 4:
@@ -52,104 +303,126 @@ def setMotor(index, speed):
     speed = 100 if speed > 100 else speed
     speed = -100 if speed < -100 else speed
     reg = __MOTOR_ADDR + index
+    if not force and __motor_ack[index] == speed:
+        __bus_stats['suppressed'] += 1
+        return speed
     
-    with SMBus(__i2c) as bus:
-        try:
-            msg = i2c_msg.write(__i2c_addr, [reg, speed.to_bytes(1, 'little', signed=True)[0]])
-            bus.i2c_rdwr(msg)
-            __motor_speed[index] = speed
-            
-        except:
-            msg = i2c_msg.write(__i2c_addr, [reg, speed.to_bytes(1, 'little', signed=True)[0]])
-            bus.i2c_rdwr(msg)
-            __motor_speed[index] = speed
+    __motor_ack[index] = None
+    __write(reg, [speed.to_bytes(1, 'little', signed=True)[0]])
+    __motor_speed[index] = speed
+    __motor_ack[index] = speed
            
     return __motor_speed[index]
 
-     
+def setMotors(speeds, force=False):
+    """
+    一次I2C传输同时设置4个电机, 从 __MOTOR_ADDR 开始连续写4个寄存器, 避免各轮更新不同步
+    :param speeds: 4个电机的速度 [v1, v2, v3, v4], 方向和限幅与 setMotor 相同
+    :param force: 为True时即使速度没有变化也写入
+    :return: 写入的4个速度
+    """
+    if len(speeds) != 4:
+        raise AttributeError("Invalid motor speeds: %s"%(speeds,))
+    buf = []
+    values = []
+    for index, speed in enumerate(speeds):
+        if index == 0 or index == 2:
+            speed = -speed
+        speed = 100 if speed > 100 else speed
+        speed = -100 if speed < -100 else speed
+        values.append(speed)
+        buf.append(speed.to_bytes(1, 'little', signed=True)[0])
+    if not force and __motor_ack == values:
+        __bus_stats['suppressed'] += 1
+        return values
+
+    __motor_ack[:] = [None, None, None, None]
+    __write(__MOTOR_ADDR, buf)
+    __motor_speed[:] = values
+    __motor_ack[:] = values
+
+    return list(__motor_speed)
+
+
 def getMotor(index):
     if index < 1 or index > 4:
         raise AttributeError("Invalid motor num: %d"%index)
     index = index - 1
     return __motor_speed[index]
 
-def setPWMServoAngle(index, angle):
+def setPWMServoAngle(servo_id, angle):
     if servo_id < 1 or servo_id > 6:
         raise AttributeError("Invalid Servo ID: %d"%servo_id)
     index = servo_id - 1
     angle = 180 if angle > 180 else angle
     angle = 0 if angle < 0 else angle
     reg = __SERVO_ADDR + index
-    with SMBus(__i2c) as bus:
-        try:
-            msg = i2c_msg.write(__i2c_addr, [reg, angle])
-            bus.i2c_rdwr(msg)
-            __servo_angle[index] = angle
-            __servo_pulse[index] = int(((200 * angle) / 9) + 500)
-
-        except:
-            msg = i2c_msg.write(__i2c_addr, [reg, angle])
-            bus.i2c_rdwr(msg)
-            __servo_angle[index] = angle
-            __servo_pulse[index] = int(((200 * angle) / 9) + 500)
+    __servo_ack[index] = None
+    __write(reg, [angle])
+    __servo_angle[index] = angle
+    __servo_pulse[index] = int(((200 * angle) / 9) + 500)
 
     return __servo_angle[index]
 
-def setPWMServoPulse(servo_id, pulse = 1500, use_time = 1000):
+def setPWMServoPulse(servo_id, pulse = 1500, use_time = 1000, force=False):
     if servo_id< 1 or servo_id > 6:
         raise AttributeError("Invalid Servo ID: %d" %servo_id)
-    deviation_data = yaml_handle.get_yaml_data(yaml_handle.Deviation_file_path)
+    deviation_data = __get_deviation()
     index = servo_id - 1
     pulse += deviation_data[str(servo_id)]
     pulse = 500 if pulse < 500 else pulse
     pulse = 2500 if pulse > 2500 else pulse
     use_time = 0 if use_time < 0 else use_time
     use_time = 30000 if use_time > 30000 else use_time
-    buf = [__SERVO_ADDR_CMD, 1] + list(use_time.to_bytes(2, 'little')) + [servo_id,] + list(pulse.to_bytes(2, 'little'))
+    if not force and __servo_ack[index] == pulse:
+        __bus_stats['suppressed'] += 1
+        return pulse
+    buf = [1] + list(use_time.to_bytes(2, 'little')) + [servo_id,] + list(pulse.to_bytes(2, 'little'))
     
-    with SMBus(__i2c) as bus:
-        try:
-            msg = i2c_msg.write(__i2c_addr, buf)
-            bus.i2c_rdwr(msg)
-            __servo_pulse[index] = pulse
-            __servo_angle[index] = int((pulse - 500) * 0.09)
-        except BaseException as e:
-            print(e)
-            msg = i2c_msg.write(__i2c_addr, buf)
-            bus.i2c_rdwr(msg)
-            __servo_pulse[index] = pulse
-            __servo_angle[index] = int((pulse - 500) * 0.09)
+    __servo_ack[index] = None
+    __write(__SERVO_ADDR_CMD, buf)
+    __servo_pulse[index] = pulse
+    __servo_angle[index] = int((pulse - 500) * 0.09)
+    __servo_ack[index] = pulse
 
     return __servo_pulse[index]
 
-def setPWMServosPulse(args):
-    ''' time,number, id1, pos1, id2, pos2...'''
-    deviation_data = yaml_handle.get_yaml_data(yaml_handle.Deviation_file_path)
+def setPWMServosPulse(args, force=False):
+    ''' time,number, id1, pos1, id2, pos2...
+    脉宽没有变化的舵机会从帧中去掉, 全部没有变化时不发送; force=True时全部发送'''
+    deviation_data = __get_deviation()
     arglen = len(args)
     servos = args[2:arglen:2]
     pulses = args[3:arglen:2]
     use_time = args[0]
     use_time = 0 if use_time < 0 else use_time
     use_time = 30000 if use_time > 30000 else use_time
-    servo_number = args[1]
-    buf = [__SERVO_ADDR_CMD, servo_number] + list(use_time.to_bytes(2, 'little'))
+    servo_number = 0
+    buf = []
+    sent = []
     dat = zip(servos, pulses)
     for (s, p) in dat:
-        buf.append(s)
         p += deviation_data[str(s)]
         p = 500 if p < 500 else p
         p = 2500 if p > 2500 else p
+        if not force and __servo_ack[s-1] == p:
+            continue
+        buf.append(s)
         buf += list(p.to_bytes(2, 'little'))  
+        sent.append((s, p))
+        servo_number += 1
+    if servo_number == 0:
+        __bus_stats['suppressed'] += 1
+        return
+    buf = [servo_number] + list(use_time.to_bytes(2, 'little')) + buf
+     
+    for (s, p) in sent:
+        __servo_ack[s-1] = None
+    __write(__SERVO_ADDR_CMD, buf)
+    for (s, p) in sent:
         __servo_pulse[s-1] = p
         __servo_angle[s-1] = int((p - 500) * 0.09)
-     
-    with SMBus(__i2c) as bus:
-        try:
-            msg = i2c_msg.write(__i2c_addr, buf)
-            bus.i2c_rdwr(msg)
-        except:
-            msg = i2c_msg.write(__i2c_addr, buf)
-            bus.i2c_rdwr(msg)
+        __servo_ack[s-1] = p
 
 
 def getPWMServoAngle(servo_id):
@@ -165,27 +438,71 @@ def getPWMServoPulse(servo_id):
     return __servo_pulse[index]
     
 def getBattery():
-    ret = 0
-    with SMBus(__i2c) as bus:
-        try:
-            msg = i2c_msg.write(__i2c_addr, [__ADC_BAT_ADDR,])
-            bus.i2c_rdwr(msg)
-            read = i2c_msg.read(__i2c_addr, 2)
-            bus.i2c_rdwr(read)
-            ret = int.from_bytes(bytes(list(read)), 'little')
-            
-        except:
-            msg = i2c_msg.write(__i2c_addr, [__ADC_BAT_ADDR,])
-            bus.i2c_rdwr(msg)
-            read = i2c_msg.read(__i2c_addr, 2)
-            bus.i2c_rdwr(read)
-            ret = int.from_bytes(bytes(list(read)), 'little')
+    ret = int.from_bytes(__read(__ADC_BAT_ADDR, 2), 'little')
            
     return ret
 
 def setBuzzer(new_state):
-    GPIO.setup(31, GPIO.OUT)
-    GPIO.output(31, new_state)
+    __get_gpio().output(__BUZZER_PIN, new_state)
+
+def __servo_direction(tx):
+    # 总线舵机是半双工的, 发送时打开TX缓冲器, 接收时打开RX缓冲器
+    __gpio.output(__SERVO_TX_PIN, 1 if tx else 0)
+    __gpio.output(__SERVO_RX_PIN, 0 if tx else 1)
+
+def __get_servo_bus():
+    global __servo_bus
+    if __servo_bus is None:
+        GPIO = __get_gpio()
+        GPIO.setup(__SERVO_RX_PIN, GPIO.OUT)
+        GPIO.setup(__SERVO_TX_PIN, GPIO.OUT)
+        __servo_direction(False)
+        port = __backend('servo_serial')(__SERVO_SERIAL_PORT, 115200, timeout=0.002)
+        __servo_bus = busservo.BusServoBus(port, __BUS_SERVO_TIMEOUT, __BUS_SERVO_RETRIES,
+                                           set_direction=__servo_direction)
+    return __servo_bus
+
+def __servo_write(id, cmd, dat1=None, dat2=None):
+    with __servo_lock:
+        __get_servo_bus().write(id, cmd, dat1, dat2)
+
+def __servo_request(id, cmd, timeout=None, retries=None):
+    with __servo_lock:
+        return __get_servo_bus().request(id, cmd, timeout, retries)
+
+def closeBusServo():
+    """关闭总线舵机串口, 下次使用时重新打开"""
+    global __servo_bus
+    with __servo_lock:
+        if __servo_bus is not None:
+            __servo_bus.close()
+            __servo_bus = None
+
+atexit.register(closeBusServo)
+
+def getBusServoStats():
+    """
+    获取总线舵机请求统计
+    :return: {'requests': 发出的读请求数(包括重发), 'replies': 收到的回复数,
+              'retries': 重发次数, 'timeouts': 重试后仍然没有回复的请求数, 'bad_frames': 校验错误的帧数}
+    """
+    with __servo_lock:
+        bus = __get_servo_bus()
+        stats = dict(bus.stats)
+        stats['bad_frames'] = bus.bad_frames
+        return stats
+
+def getBusServos(ids, properties=('pulse', 'temp', 'vin'), timeout=None, retries=None):
+    """
+    批量读取多个舵机的多个属性, 收到一个回复后立即发下一个请求, 不再每次调用都单独等待
+    :param ids: 舵机id列表
+    :param properties: 属性名, 可选 'id' 'pulse' 'temp' 'vin' 'deviation' 'angle_limit' 'vin_limit' 'temp_limit' 'load'
+    :param timeout: 每个请求等待回复的时间(秒), 默认 __BUS_SERVO_TIMEOUT
+    :param retries: 超时后重发的次数, 默认 __BUS_SERVO_RETRIES
+    :return: {舵机id: {属性名: 值}}, 没有回复的值为 None
+    """
+    with __servo_lock:
+        return __get_servo_bus().read_properties(ids, properties, timeout, retries)
 
 def setBusServoID(oldid, newid):
     """
@@ -193,24 +510,17 @@ def setBusServoID(oldid, newid):
     :param oldid: 原来的id， 出厂默认为1
     :param newid: 新的id
     """
-    serial_serro_wirte_cmd(oldid, LOBOT_SERVO_ID_WRITE, newid)
+    __servo_write(oldid, busservo.LOBOT_SERVO_ID_WRITE, newid)
 
-def getBusServoID(id=None):
+def getBusServoID(id=None, timeout=None, retries=None):
     """
     读取串口舵机id
-    :param id: 默认为空
-    :return: 返回舵机id
+    :param id: 默认为空, 为空时总线上只能有一个舵机
+    :return: 返回舵机id, 没有回复时返回None
     """
-    
-    while True:
-        if id is None:  # 总线上只能有一个舵机
-            serial_servo_read_cmd(0xfe, LOBOT_SERVO_ID_READ)
-        else:
-            serial_servo_read_cmd(id, LOBOT_SERVO_ID_READ)
-        # 获取内容
-        msg = serial_servo_get_rmsg(LOBOT_SERVO_ID_READ)
-        if msg is not None:
-            return msg
+    if id is None:  # 总线上只能有一个舵机
+        id = busservo.BROADCAST_ID
+    return __servo_request(id, busservo.LOBOT_SERVO_ID_READ, timeout, retries)
 
 def setBusServoPulse(id, pulse, use_time):
     """
@@ -224,15 +534,15 @@ def setBusServoPulse(id, pulse, use_time):
     pulse = 1000 if pulse > 1000 else pulse
     use_time = 0 if use_time < 0 else use_time
     use_time = 30000 if use_time > 30000 else use_time
-    serial_serro_wirte_cmd(id, LOBOT_SERVO_MOVE_TIME_WRITE, pulse, use_time)
+    __servo_write(id, busservo.LOBOT_SERVO_MOVE_TIME_WRITE, pulse, use_time)
 
 def stopBusServo(id=None):
     '''
     停止舵机运行
-    :param id:
+    :param id: 默认为空, 为空时停止总线上所有舵机
     :return:
     '''
-    serial_serro_wirte_cmd(id, LOBOT_SERVO_MOVE_STOP)
+    __servo_write(busservo.BROADCAST_ID if id is None else id, busservo.LOBOT_SERVO_MOVE_STOP)
 
 def setBusServoDeviation(id, d=0):
     """
@@ -240,33 +550,22 @@ def setBusServoDeviation(id, d=0):
     :param id: 舵机id
     :param d:  偏差
     """
-    serial_serro_wirte_cmd(id, LOBOT_SERVO_ANGLE_OFFSET_ADJUST, d)
+    __servo_write(id, busservo.LOBOT_SERVO_ANGLE_OFFSET_ADJUST, d)
 
 def saveBusServoDeviation(id):
     """
     配置偏差，掉电保护
     :param id: 舵机id
     """
-    serial_serro_wirte_cmd(id, LOBOT_SERVO_ANGLE_OFFSET_WRITE)
+    __servo_write(id, busservo.LOBOT_SERVO_ANGLE_OFFSET_WRITE)
 
-time_out = 50
-def getBusServoDeviation(id):
+def getBusServoDeviation(id, timeout=None, retries=None):
     '''
     读取偏差值
     :param id: 舵机号
-    :return:
+    :return: 没有回复时返回None
     '''
-    # 发送读取偏差指令
-    count = 0
-    while True:
-        serial_servo_read_cmd(id, LOBOT_SERVO_ANGLE_OFFSET_READ)
-        # 获取
-        msg = serial_servo_get_rmsg(LOBOT_SERVO_ANGLE_OFFSET_READ)
-        count += 1
-        if msg is not None:
-            return msg
-        if count > time_out:
-            return None
+    return __servo_request(id, busservo.LOBOT_SERVO_ANGLE_OFFSET_READ, timeout, retries)
 
 def setBusServoAngleLimit(id, low, high):
     '''
@@ -276,21 +575,15 @@ def setBusServoAngleLimit(id, low, high):
     :param high:
     :return:
     '''
-    serial_serro_wirte_cmd(id, LOBOT_SERVO_ANGLE_LIMIT_WRITE, low, high)
+    __servo_write(id, busservo.LOBOT_SERVO_ANGLE_LIMIT_WRITE, low, high)
 
-def getBusServoAngleLimit(id):
+def getBusServoAngleLimit(id, timeout=None, retries=None):
     '''
     读取舵机转动范围
     :param id:
-    :return: 返回元祖 0： 低位  1： 高位
+    :return: 返回元祖 0： 低位  1： 高位, 没有回复时返回None
     '''
-    
-    while True:
-        serial_servo_read_cmd(id, LOBOT_SERVO_ANGLE_LIMIT_READ)
-        msg = serial_servo_get_rmsg(LOBOT_SERVO_ANGLE_LIMIT_READ)
-        if msg is not None:
-            count = 0
-            return msg
+    return __servo_request(id, busservo.LOBOT_SERVO_ANGLE_LIMIT_READ, timeout, retries)
 
 def setBusServoVinLimit(id, low, high):
     '''
@@ -300,19 +593,15 @@ def setBusServoVinLimit(id, low, high):
     :param high:
     :return:
     '''
-    serial_serro_wirte_cmd(id, LOBOT_SERVO_VIN_LIMIT_WRITE, low, high)
+    __servo_write(id, busservo.LOBOT_SERVO_VIN_LIMIT_WRITE, low, high)
 
-def getBusServoVinLimit(id):
+def getBusServoVinLimit(id, timeout=None, retries=None):
     '''
-    读取舵机转动范围
+    读取舵机电压范围
     :param id:
-    :return: 返回元祖 0： 低位  1： 高位
+    :return: 返回元祖 0： 低位  1： 高位, 没有回复时返回None
     '''
-    while True:
-        serial_servo_read_cmd(id, LOBOT_SERVO_VIN_LIMIT_READ)
-        msg = serial_servo_get_rmsg(LOBOT_SERVO_VIN_LIMIT_READ)
-        if msg is not None:
-            return msg
+    return __servo_request(id, busservo.LOBOT_SERVO_VIN_LIMIT_READ, timeout, retries)
 
 def setBusServoMaxTemp(id, m_temp):
     '''
@@ -321,76 +610,53 @@ def setBusServoMaxTemp(id, m_temp):
     :param m_temp:
     :return:
     '''
-    serial_serro_wirte_cmd(id, LOBOT_SERVO_TEMP_MAX_LIMIT_WRITE, m_temp)
+    __servo_write(id, busservo.LOBOT_SERVO_TEMP_MAX_LIMIT_WRITE, m_temp)
 
-def getBusServoTempLimit(id):
+def getBusServoTempLimit(id, timeout=None, retries=None):
     '''
     读取舵机温度报警范围
     :param id:
-    :return:
+    :return: 没有回复时返回None
     '''
-    
-    while True:
-        serial_servo_read_cmd(id, LOBOT_SERVO_TEMP_MAX_LIMIT_READ)
-        msg = serial_servo_get_rmsg(LOBOT_SERVO_TEMP_MAX_LIMIT_READ)
-        if msg is not None:
-            return msg
+    return __servo_request(id, busservo.LOBOT_SERVO_TEMP_MAX_LIMIT_READ, timeout, retries)
 
-def getBusServoPulse(id):
+def getBusServoPulse(id, timeout=None, retries=None):
     '''
     读取舵机当前位置
     :param id:
-    :return:
+    :return: 没有回复时返回None
     '''
-    while True:
-        serial_servo_read_cmd(id, LOBOT_SERVO_POS_READ)
-        msg = serial_servo_get_rmsg(LOBOT_SERVO_POS_READ)
-        if msg is not None:
-            return msg
+    return __servo_request(id, busservo.LOBOT_SERVO_POS_READ, timeout, retries)
 
-def getBusServoTemp(id):
+def getBusServoTemp(id, timeout=None, retries=None):
     '''
     读取舵机温度
     :param id:
-    :return:
+    :return: 没有回复时返回None
     '''
-    while True:
-        serial_servo_read_cmd(id, LOBOT_SERVO_TEMP_READ)
-        msg = serial_servo_get_rmsg(LOBOT_SERVO_TEMP_READ)
-        if msg is not None:
-            return msg
+    return __servo_request(id, busservo.LOBOT_SERVO_TEMP_READ, timeout, retries)
 
-def getBusServoVin(id):
+def getBusServoVin(id, timeout=None, retries=None):
     '''
     读取舵机电压
     :param id:
-    :return:
+    :return: 没有回复时返回None
     '''
-    while True:
-        serial_servo_read_cmd(id, LOBOT_SERVO_VIN_READ)
-        msg = serial_servo_get_rmsg(LOBOT_SERVO_VIN_READ)
-        if msg is not None:
-            return msg
+    return __servo_request(id, busservo.LOBOT_SERVO_VIN_READ, timeout, retries)
 
 def restBusServoPulse(oldid):
     # 舵机清零偏差和P值中位（500）
-    serial_servo_set_deviation(oldid, 0)    # 清零偏差
+    setBusServoDeviation(oldid, 0)    # 清零偏差
     time.sleep(0.1)
-    serial_serro_wirte_cmd(oldid, LOBOT_SERVO_MOVE_TIME_WRITE, 500, 100)    # 中位
+    __servo_write(oldid, busservo.LOBOT_SERVO_MOVE_TIME_WRITE, 500, 100)    # 中位
 
 ##掉电
 def unloadBusServo(id):
-    serial_serro_wirte_cmd(id, LOBOT_SERVO_LOAD_OR_UNLOAD_WRITE, 0)
+    __servo_write(id, busservo.LOBOT_SERVO_LOAD_OR_UNLOAD_WRITE, 0)
 
 ##读取是否掉电
-def getBusServoLoadStatus(id):
-    while True:
-        serial_servo_read_cmd(id, LOBOT_SERVO_LOAD_OR_UNLOAD_READ)
-        msg = serial_servo_get_rmsg(LOBOT_SERVO_LOAD_OR_UNLOAD_READ)
-        if msg is not None:
-            return msg
-
-setBuzzer(0)
+def getBusServoLoadStatus(id, timeout=None, retries=None):
+    return __servo_request(id, busservo.LOBOT_SERVO_LOAD_OR_UNLOAD_READ, timeout, retries)
 
 # setMotor(1, 60)
 # setMotor(2, 60)
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# coding=utf8
+"""
+Arduino 发射通道: 控制线程只修改状态, 后台线程负责写串口
+协议: 每行一个状态 b'1\n'(发射) / b'0\n'(停止); 开启应答时 Arduino 每收到一行回复一行
+串口设备重新枚举(如 ttyACM0 变成 ttyACM1)时, 后台线程按退避时间重新查找并连接, 不阻塞控制线程
+"""
+import glob
+import time
+import queue
+import threading
+from metrics import Histogram
+
+FIRE_ON = b'1\n'
+FIRE_OFF = b'0\n'
+
+# 重连的退避时间(秒): 从 RECONNECT_MIN 开始每次失败翻倍, 最长 RECONNECT_MAX
+RECONNECT_MIN = 0.1
+RECONNECT_MAX = 2.0
+
+def find_ports(patterns=('/dev/ttyACM*', '/dev/ttyUSB*')):
+    """列出可能是 Arduino 的串口"""
+    ports = []
+    for pattern in patterns:
+        ports += sorted(glob.glob(pattern))
+    return ports
+
+class PortManager:
+    """
+    查找并打开 Arduino 串口
+    按顺序尝试: 上一次成功的端口, preferred, find_ports() 找到的端口
+    给出 handshake 时打开后等待 settle 秒(Arduino 打开串口时会复位), 发送 handshake 并要求回复以 expect 开头,
+    否则只要能打开就认为是 Arduino
+    """
+    def __init__(self, preferred=None, baudrate=115200, timeout=0.2, candidates=find_ports,
+                 handshake=None, expect=b'', settle=0.0, serial_factory=None):
+        """
+        :param candidates: 无参数函数, 返回候选的串口路径列表
+        :param serial_factory: 默认 serial.Serial
+        """
+        self.preferred = preferred
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.candidates = candidates
+        self.handshake = handshake
+        self.expect = expect
+        self.settle = settle
+        self.serial_factory = serial_factory
+        self.path = None  # 最近一次成功打开的端口
+
+    def ports(self):
+        ports = []
+        for path in [self.path, self.preferred] + list(self.candidates()):
+            if path and path not in ports:
+                ports.append(path)
+        return ports
+
+    def _probe(self, port):
+        if self.settle:
+            time.sleep(self.settle)
+        port.reset_input_buffer()
+        port.write(self.handshake)
+        reply = port.readline()
+        return bool(reply) and reply.startswith(self.expect)
+
+    def open(self):
+        """
+        :return: 打开的串口对象
+        :raise IOError: 没有找到可用的端口
+        """
+        factory = self.serial_factory
+        if factory is None:
+            import serial
+            factory = serial.Serial
+        errors = []
+        for path in self.ports():
+            try:
+                port = factory(path, self.baudrate, timeout=self.timeout)
+            except Exception as e:
+                errors.append(f"{path}: {e}")
+                continue
+            try:
+                if self.handshake is None or self._probe(port):
+                    self.path = path
+                    return port
+                errors.append(f"{path}: 握手没有回复")
+            except Exception as e:
+                errors.append(f"{path}: {e}")
+            port.close()
+        raise IOError("未找到 Arduino (%s)" % ('; '.join(errors) or "没有候选端口"))
+
+class ArduinoLink:
+    """
+    Arduino 串口连接
+    set_fire() 只在状态变化时把消息放进有界队列, 队列满时丢弃最旧的消息; 后台线程按顺序写串口
+    没有新消息时每隔 heartbeat 秒重发一次当前状态作为心跳(重复的状态对 Arduino 没有影响)
+    ack=True 时每写一行等待 ack_timeout 秒读取一行回复, 没有回复时在下一次心跳前重发
+    串口在后台线程里打开; 写入失败时关闭串口, 按退避时间重新打开, 连上后先发送当前状态
+    """
+    def __init__(self, port, baudrate=115200, queue_size=8, heartbeat=1.0, ack=False, ack_timeout=0.2):
+        """
+        :param port: PortManager, 串口路径, 或者已经打开的串口对象(sim.FakeSerial 等, 这时不会重连)
+        """
+        if isinstance(port, str):
+            port = PortManager(port, baudrate, ack_timeout, candidates=list)
+        if isinstance(port, PortManager):
+            self.manager = port
+            self.port = None
+        else:
+            self.manager = None
+            self.port = port
+        self.heartbeat = heartbeat
+        self.ack = ack
+        self.ack_timeout = ack_timeout
+        self.fire = False
+        self.write_latency = Histogram()  # 从 set_fire() 到写完串口
+        self.ack_latency = Histogram()    # 从写完到收到回复
+        self.recovery_time = Histogram()  # 从断开到重新连上
+        self.stats = {'sent': 0, 'heartbeats': 0, 'dropped': 0, 'errors': 0, 'acks': 0, 'ack_timeouts': 0,
+                      'reconnects': 0}
+        self.last_error = None
+        self.probe = None  # 耗时统计回调 probe(阶段名, 秒), 统计每次写串口(包括重连和等待回复)的耗时
+        self._disconnected_at = time.monotonic()
+        self._backoff = RECONNECT_MIN
+        self._next_connect = 0.0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._resend = False
+        self._running = False
+        self._thread = None
+
+    def start(self, thread=True):
+        """
+        :param thread: False 时不启动后台线程, 由调用者先调用 open() 再循环调用 service()(如 runtime 的任务)
+        """
+        if self._running:
+            return
+        self._running = True
+        if thread:
+            self._thread = threading.Thread(target=self._run, name='arduino', daemon=True)
+            self._thread.start()
+
+    def stop(self, fire_off=True):
+        """
+        让后台线程(或循环调用 service() 的一方)发完队列里的消息后退出, 不等待
+        :param fire_off: 为True时先发送停止
+        """
+        if fire_off:
+            self.set_fire(False, force=True)
+        self._running = False
+        self._put((None, None))  # 唤醒后台线程
+
+    def close(self, fire_off=True):
+        """停止后台线程并关闭串口, fire_off=True 时先发送停止"""
+        self.stop(fire_off)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._disconnect()
+
+    def set_fire(self, state, force=False):
+        """
+        设置发射状态, 不阻塞
+        :param force: 为True时即使状态没有变化也发送
+        :return: 是否放进了发送队列
+        """
+        state = bool(state)
+        if state == self.fire and not force:
+            return False
+        self.fire = state
+        self._put((FIRE_ON if state else FIRE_OFF, time.monotonic()))
+        return True
+
+    def _put(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.stats['dropped'] += 1
+                except queue.Empty:
+                    pass
+
+    @property
+    def connected(self):
+        return self.port is not None
+
+    def snapshot(self):
+        """返回可以直接转成JSON的统计结果"""
+        return {
+            'connected': self.connected,
+            'path': self.manager.path if self.manager is not None else None,
+            'recovery_time': self.recovery_time.snapshot(),
+            'fire': self.fire,
+            'queued': self._queue.qsize(),
+            'stats': dict(self.stats),
+            'last_error': self.last_error,
+            'write_latency': self.write_latency.snapshot(),
+            'ack_latency': self.ack_latency.snapshot(),
+        }
+
+    def _error(self, e):
+        self.stats['errors'] += 1
+        if str(e) != self.last_error:
+            print(f"Arduino 串口错误: {e}")
+        self.last_error = str(e)
+
+    def _disconnect(self):
+        port, self.port = self.port, None
+        if port is not None:
+            try:
+                port.close()
+            except Exception:
+                pass
+
+    def _connect(self):
+        """按退避时间尝试重新打开串口, 返回是否已连接"""
+        if self.port is not None:
+            return True
+        if self.manager is None or time.monotonic() < self._next_connect:
+            return False
+        try:
+            self.port = self.manager.open()
+        except Exception as e:
+            self._error(e)
+            self._next_connect = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, RECONNECT_MAX)
+            return False
+        recovery = time.monotonic() - self._disconnected_at
+        if self.stats['sent'] or self.stats['errors']:
+            self.stats['reconnects'] += 1
+            self.recovery_time.record(recovery)
+            print(f"Arduino 已重新连接 {self.manager.path}, 用时 {recovery:.2f}s")
+        self._backoff = RECONNECT_MIN
+        self.last_error = None
+        return True
+
+    def _write(self, line, queued_at=None):
+        if not self._connect():
+            self._resend = True
+            return
+        if self._resend and line != (FIRE_ON if self.fire else FIRE_OFF):
+            line = FIRE_ON if self.fire else FIRE_OFF  # 重新连上后只需要发送最新的状态
+        try:
+            self.port.write(line)
+        except Exception as e:
+            self._error(e)
+            if self.manager is not None:
+                self._disconnect()
+                self._disconnected_at = time.monotonic()
+            self._resend = True
+            return
+        done = time.monotonic()
+        if queued_at is not None:
+            self.write_latency.record(done - queued_at)
+        self.stats['sent'] += 1
+        self._resend = False
+        if self.ack:
+            try:
+                reply = self.port.readline()
+            except Exception as e:
+                self._error(e)
+                reply = b''
+            if reply:
+                self.stats['acks'] += 1
+                self.ack_latency.record(time.monotonic() - done)
+            else:
+                self.stats['ack_timeouts'] += 1
+                self._resend = True
+
+    def open(self):
+        """尝试打开串口, 打不开时之后按退避时间重试; 返回是否已连接"""
+        self._resend = not self._connect()
+        return not self._resend
+
+    def service(self):
+        """
+        发送一条队列里的消息, 没有消息时等待最多一个心跳周期, 然后发送心跳或重发
+        :return: False 表示已经停止并且队列里的消息都发完了
+        """
+        if not self._running and self._queue.empty():
+            return False
+        try:
+            if not self._resend:
+                timeout = self.heartbeat
+            elif self.port is None:
+                timeout = max(self._next_connect - time.monotonic(), 0.01)
+            else:
+                timeout = self.ack_timeout
+            line, queued_at = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            if not self._running:
+                return False
+            # 心跳, 或者重发上一次没有应答的状态
+            if not self._resend:
+                self.stats['heartbeats'] += 1
+            self._send(FIRE_ON if self.fire else FIRE_OFF)
+            return True
+        if line is not None:
+            self._send(line, queued_at)
+        return True
+
+    def _send(self, line, queued_at=None):
+        probe = self.probe
+        if probe is None:
+            self._write(line, queued_at)
+            return
+        start = time.perf_counter()
+        self._write(line, queued_at)
+        probe('arduino', time.perf_counter() - start)
+
+    def _run(self):
+        self.open()
+        while self.service():
+            pass
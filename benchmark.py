@@ -0,0 +1,631 @@
+#!/usr/bin/env python3
+# coding=utf8
+"""
+控制栈性能测试, 使用 sim.py 中的模拟硬件, 不需要连接扩展板
+用法: python3 benchmark.py [--json [文件]] [--only 名称 ...]
+--json 输出固定格式的JSON(键排序), 用于比较不同版本的结果
+"""
+import os
+import sys
+import time
+import types
+# --json 输出到标准输出时不能混入 pygame 的欢迎信息
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+# 测的是本仓库的 Board.py 和 mecanum.py, 不是树莓派上安装的 SDK:
+# 先导入同目录下的模块, 再让各模块的 HiwonderSDK.Board / HiwonderSDK.mecanum 也指向它们
+# Board.py 在 Board.init() 时才加载硬件库, 这里一直用 sim.backends() 中的模拟后端, 普通 Linux 上也能运行
+sys.modules['HiwonderSDK'] = _sdk = types.ModuleType('HiwonderSDK')
+import busservo
+sys.modules['HiwonderSDK.busservo'] = _sdk.busservo = busservo
+import Board
+sys.modules['HiwonderSDK.Board'] = _sdk.Board = Board
+import mecanum
+sys.modules['HiwonderSDK.mecanum'] = _sdk.mecanum = mecanum
+from mecanum import MecanumChassis, SlewLimiter
+import sim
+from sim import FakeSMBus, FakeI2CMsg
+
+
+def timeit(func, n=1000):
+    """运行 func n 次, 返回每次调用的平均耗时(微秒)"""
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def bench_bus_handle(n=1000):
+    """每次写寄存器都打开总线 vs 常驻总线句柄"""
+    def open_per_call():
+        with FakeSMBus(1) as bus:
+            bus.i2c_rdwr(FakeI2CMsg.write(0x7A, [31, 50]))
+
+    Board.setBusFactory(FakeSMBus)
+    results = {
+        'open_per_call_us': timeit(open_per_call, n),
+        'persistent_us': timeit(lambda: Board.setMotor(1, 50, force=True), n),
+    }
+    Board.closeBus()
+    return results
+
+
+def bench_motor_write(n=1000):
+    """4次单电机写入 vs 一次4电机连续写入"""
+    def four_writes():
+        for i in range(1, 5):
+            Board.setMotor(i, 50, force=True)
+
+    Board.setBusFactory(FakeSMBus)
+    results = {
+        'setMotor_x4_us': timeit(four_writes, n),
+        'setMotors_us': timeit(lambda: Board.setMotors([50, 50, 50, 50], force=True), n),
+    }
+    Board.closeBus()
+    return results
+
+
+def bench_idle_writes(n=1000):
+    """停车空闲时每个循环的 reset_motors, 统计实际发送和省略的传输数"""
+    Board.setBusFactory(FakeSMBus)
+    chassis = MecanumChassis()
+    Board.resetBusStats()
+    us = timeit(chassis.reset_motors, n)
+    stats = Board.getBusStats()
+    Board.closeBus()
+    return {
+        'idle_tick_us': us,
+        'idle_sent_per_tick': stats['sent'] / n,
+        'idle_suppressed_per_tick': stats['suppressed'] / n,
+    }
+
+
+class _YamlDeviation:
+    """用真实的YAML文件作为偏差文件, 和树莓派上的 yaml_handle 一样每次解析文件"""
+    def __init__(self, path):
+        self.Deviation_file_path = path
+
+    @staticmethod
+    def get_yaml_data(path):
+        import yaml
+        with open(path) as f:
+            return yaml.safe_load(f)
+
+
+def bench_deviation(n=1000):
+    """每次调用都读取偏差文件 vs 使用缓存的偏差表"""
+    import tempfile
+    fd, deviation_path = tempfile.mkstemp(suffix='.yaml')
+    with os.fdopen(fd, 'w') as f:
+        f.write(''.join("'%d': 0\n" % i for i in range(1, 7)))
+
+    def reload_per_call():
+        Board.reloadDeviation()
+        Board.setPWMServoPulse(6, 1500, 20, force=True)
+
+    Board.init(sim.backends(yaml=_YamlDeviation(deviation_path)))
+    results = {
+        'servo_reload_deviation_us': timeit(reload_per_call, n),
+        'servo_cached_deviation_us': timeit(lambda: Board.setPWMServoPulse(6, 1500, 20, force=True), n),
+    }
+    Board.init(sim.backends())
+    os.remove(deviation_path)
+    return results
+
+
+def bench_servo_writes(n=1000):
+    """单个舵机写入 / 两个舵机合并一帧写入 / 读电池电压, 以及每次调用的总线传输数"""
+    board = sim.SimBoard()
+    Board.init(sim.backends(board=board))
+    pulse = [1500]
+
+    def single():
+        pulse[0] = 1000 + (pulse[0] + 1) % 1000
+        Board.setPWMServoPulse(6, pulse[0], 20)
+
+    def pair():
+        pulse[0] = 1000 + (pulse[0] + 1) % 1000
+        Board.setPWMServosPulse([20, 2, 6, pulse[0], 5, pulse[0]])
+
+    results = {}
+    for name, func in (('servo_single', single), ('servo_pair', pair), ('battery', Board.getBattery)):
+        board.reset_stats()
+        results[f'{name}_us'] = timeit(func, n)
+        results[f'{name}_transactions'] = board.transactions / n
+    Board.init(sim.backends())
+    return results
+
+
+def bench_bus_servo(rounds=20, ids=(1, 2, 3, 4, 5, 6), properties=('pulse', 'temp', 'vin')):
+    """总线舵机: 逐个读取 / 批量读取 / 丢失10%回复时批量读取的耗时和重试情况"""
+    from sim import SimServoSerial
+    results = {}
+    for name, drop_rate in (('servo_bus', 0.0), ('servo_bus_lossy', 0.1)):
+        port = SimServoSerial(drop_rate=drop_rate)
+        Board.init(sim.backends(servo_serial=lambda *args, **kwargs: port))
+
+        def one_by_one():
+            for servo_id in ids:
+                Board.getBusServoPulse(servo_id, timeout=0.01)
+                Board.getBusServoTemp(servo_id, timeout=0.01)
+                Board.getBusServoVin(servo_id, timeout=0.01)
+
+        def batched():
+            Board.getBusServos(ids, properties, timeout=0.01)
+
+        if not drop_rate:
+            results[f'{name}_single_ms'] = timeit(one_by_one, rounds) / 1000
+        results[f'{name}_batch_ms'] = timeit(batched, rounds) / 1000
+        stats = Board.getBusServoStats()
+        results[f'{name}_retries'] = stats['retries']
+        results[f'{name}_timeouts'] = stats['timeouts']
+    Board.init(sim.backends())
+    return results
+
+
+def bench_arduino_link(cycles=3, n=1000):
+    """Arduino 发射通道: set_fire() 在控制线程里的耗时, 拔插 pty 模拟设备后的恢复时间"""
+    from sim import PtyArduino
+    from arduino import ArduinoLink, PortManager
+    device = PtyArduino()
+    link = ArduinoLink(PortManager(candidates=lambda: [device.path] if device.path else []), heartbeat=0.05)
+    link.start()
+    state = [False]
+
+    def toggle():
+        state[0] = not state[0]
+        link.set_fire(state[0])
+
+    results = {'set_fire_us': timeit(toggle, n)}
+    time.sleep(0.1)
+    for _ in range(cycles):
+        device.unplug()
+        time.sleep(0.2)
+        device.plug()
+        deadline = time.monotonic() + 5
+        while link.stats['reconnects'] < _ + 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    link.close()
+    device.close()
+    results['reconnects'] = link.stats['reconnects']
+    results['recovery_mean_ms'] = link.recovery_time.mean * 1000
+    results['recovery_max_ms'] = (link.recovery_time.max or 0.0) * 1000
+    results['write_p99_ms'] = link.write_latency.percentile(99) * 1000
+    return results
+
+
+def bench_telemetry(n=1000):
+    """控制循环里读电池电压: 直接读总线 vs 读 BatteryMonitor 缓存的值"""
+    from telemetry import BatteryMonitor
+    Board.init(sim.backends())
+    monitor = BatteryMonitor()
+    monitor.sample()
+    return {
+        'battery_bus_us': timeit(Board.getBattery, n),
+        'battery_cached_us': timeit(lambda: monitor.voltage, n),
+    }
+
+
+def bench_chassis_commands(n=1000):
+    """底盘命令(计算 + 写电机)的耗时: set_velocity / translation / move"""
+    board = sim.SimBoard()
+    Board.init(sim.backends(board=board))
+    chassis = MecanumChassis()
+    speed = [0]
+
+    def command(func):
+        def run():
+            speed[0] = (speed[0] + 1) % 50
+            func(speed[0])
+        return run
+
+    results = {}
+    for name, func in (('set_velocity', lambda v: chassis.set_velocity(v, 45, 0.1)),
+                       ('translation', lambda v: chassis.translation(v, -v)),
+                       ('move', lambda v: chassis.move(v, -v, 0.1))):
+        board.reset_stats()
+        results[f'{name}_us'] = timeit(command(func), n)
+        results[f'{name}_transactions'] = board.transactions / n
+    Board.init(sim.backends())
+    return results
+
+
+def drive_script(ticks=500):
+    """
+    手柄脚本: 左摇杆转圈, 右摇杆来回摆动云台, 右扳机周期性转向, 每100个周期按一次B
+    :return: sim.ScriptedGamepad 使用的 [(各轴的值, 按钮位掩码), ...]
+    """
+    import math
+    from gamepad import XboxButtons
+    script = []
+    for i in range(ticks):
+        phase = 2 * math.pi * i / ticks
+        rt = 0.5 if (i // 50) % 2 else -1.0
+        axes = (round(math.cos(phase), 2), round(math.sin(phase), 2),
+                round(math.sin(phase * 3), 2), 0.0, -1.0, rt)
+        buttons = (1 << XboxButtons.B) if i % 100 < 5 else 0
+        script.append((axes, buttons))
+    return script
+
+
+def bench_controller_tick(ticks=2000):
+    """无界面运行 GamepadController.tick(): 模拟扩展板 + 脚本手柄 + 模拟串口"""
+    from car_control_pygame import GamepadController
+    from sim import ScriptedGamepad, FakeSerial
+    from metrics import Histogram
+
+    board = sim.SimBoard()
+    Board.init(sim.backends(board=board))
+    arduino = FakeSerial()
+    controller = GamepadController(ScriptedGamepad(drive_script()), arduino, use_sampler=False)
+    controller.start()
+    # 连续运行时两次 tick() 之间只有几十微秒, 加速度限制会让轮速几乎不变, 关掉以测量每周期都写电机的情况
+    controller.chassis.set_profile(None)
+    latency = Histogram()
+    board.reset_stats()
+    Board.resetBusStats()
+    start = time.perf_counter()
+    for _ in range(ticks):
+        t = time.perf_counter()
+        controller.tick()
+        latency.record(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    controller.effects.stop()
+    controller.battery.stop()
+    controller.arduino.close(fire_off=False)  # 等后台线程写完队列里的消息
+    bus = Board.getBusStats()
+    Board.init(sim.backends())
+    return {
+        'tick_per_s': ticks / elapsed,
+        'tick_p50_us': latency.percentile(50) * 1e6,
+        'tick_p99_us': latency.percentile(99) * 1e6,
+        'tick_transactions': board.transactions / ticks,
+        'tick_suppressed_writes': bus['suppressed'] / ticks,
+        'tick_serial_writes': len(arduino.written) / ticks,
+    }
+
+
+def bench_replay(ticks=1000):
+    """记录一段脚本手柄的控制周期, 再尽快回放, 检查回放结果和记录是否一致"""
+    import tempfile
+    from car_control_pygame import GamepadController
+    from sim import ScriptedGamepad, FakeSerial
+    from recorder import replay, RECORD
+
+    fd, log_path = tempfile.mkstemp(suffix='.log')
+    os.close(fd)
+    Board.init(sim.backends(board=sim.SimBoard(latency=0)))
+    controller = GamepadController(ScriptedGamepad(drive_script()), FakeSerial(), use_sampler=False,
+                                   record_path=log_path)
+    for _ in range(ticks):
+        controller.tick()
+    controller.close()
+    result = replay(log_path, realtime=False)
+    os.remove(log_path)
+    return {
+        'replay_tick_per_s': result['ticks'] / result['elapsed_s'],
+        'replay_mismatches': result['mismatches'],
+        'record_bytes_per_tick': RECORD.size,
+    }
+
+
+def bench_camera(seconds=3.0):
+    """控制周期耗时: 不开摄像头 / 在循环里直接读摄像头 / 采集线程只取最新帧"""
+    import cv2
+    from sim import MJPEGServer
+    from camera import FrameGrabber
+
+    Board.setBusFactory(FakeSMBus)
+    chassis = MecanumChassis()
+    server = MJPEGServer(fps=30)
+
+    def run(read_frame):
+        samples = []
+        end = time.perf_counter() + seconds
+        speed = 0
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            speed = (speed + 1) % 50
+            chassis.set_velocity(speed, 90, 0)
+            read_frame()
+            samples.append(time.perf_counter() - start)
+            time.sleep(0.002)
+        samples.sort()
+        return samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+    results = {}
+    results['camera_off_p50_us'], results['camera_off_p99_us'] = run(lambda: None)
+
+    cap = cv2.VideoCapture(server.url)
+    results['camera_inline_p50_us'], results['camera_inline_p99_us'] = run(cap.read)
+    cap.release()
+
+    grabber = FrameGrabber(server.url)
+    grabber.start()
+    results['camera_thread_p50_us'], results['camera_thread_p99_us'] = run(grabber.read)
+    grabber.stop()
+
+    server.close()
+    Board.closeBus()
+    return results
+
+
+def sim_controller(board=None):
+    """模拟硬件上的无界面控制器, 多进程测试中在控制进程里调用"""
+    from car_control_pygame import GamepadController
+    from sim import ScriptedGamepad, FakeSerial
+    Board.init(sim.backends() if board is None else sim.backends(board=board))
+    return GamepadController(ScriptedGamepad(drive_script()), FakeSerial(), use_sampler=False)
+
+
+def bench_multiprocess(seconds=3.0):
+    """
+    有视频负载时的控制周期抖动: 控制, 解码和界面在同一个进程里 vs 控制进程 + 摄像头进程 + 界面进程
+    两种情况界面做同样的工作(取最新帧, 画HUD), 都不打开窗口; 都从控制器初始化完成后计时, 周期数应该相近
+    """
+    from sim import MJPEGServer
+    from camera import FrameGrabber
+    import car_control_ui
+
+    server = MJPEGServer(fps=30)
+    results = {}
+
+    controller = sim_controller()
+    controller.start()
+    camera = FrameGrabber(server.url)
+    camera.start()
+    hud = car_control_ui.create_hud()
+    scheduler = controller.scheduler
+    end = time.monotonic() + seconds
+
+    def update():
+        controller.tick()
+        seq, frame = camera.read()
+        hud.set_frame(seq, frame)
+        hud.set_field('ptz', f"({controller.gimbal.pan}, {controller.gimbal.tilt})")
+        hud.set_field('control', car_control_ui.format_control(scheduler.period.percentile(99),
+                                                               scheduler.overruns))
+        return time.monotonic() < end
+
+    scheduler.run(update)
+    camera.stop()
+    controller.close()
+    results['single_period_p99_ms'] = scheduler.period.percentile(99) * 1000
+    results['single_period_max_ms'] = (scheduler.period.max or 0) * 1000
+    results['single_overruns'] = scheduler.overruns
+    results['single_ticks'] = scheduler.ticks
+
+    state = car_control_ui.run_multiprocess(server.url, sim_controller, show=False, seconds=seconds)
+    results['multi_period_p99_ms'] = state.period_p99 * 1000 if state else 0.0
+    results['multi_overruns'] = state.overruns if state else 0
+    results['multi_ticks'] = state.tick if state else 0
+
+    server.close()
+    Board.init(sim.backends())
+    return results
+
+
+def bench_runtime(seconds=3.0):
+    """asyncio 运行时上的无界面控制器: 控制周期抖动, 输入到电机延迟, 每周期的总线传输数"""
+    import asyncio
+    from runtime import Runtime
+
+    board = sim.SimBoard()
+    controller = sim_controller(board)
+    runtime = Runtime(controller)
+
+    async def timer(runtime):
+        await asyncio.sleep(seconds)
+
+    runtime.add_task('timer', timer)
+    runtime.run()
+    scheduler = controller.scheduler
+    Board.init(sim.backends())
+    return {
+        'runtime_ticks': scheduler.ticks,
+        'runtime_period_p99_ms': scheduler.period.percentile(99) * 1000,
+        'runtime_work_p99_ms': scheduler.work_time.percentile(99) * 1000,
+        'runtime_overruns': scheduler.overruns,
+        'runtime_input_latency_p99_ms': controller.input_latency.percentile(99) * 1000,
+        'runtime_tick_transactions': board.transactions / max(scheduler.ticks, 1),
+    }
+
+
+def bench_hud(n=500):
+    """每帧新建信息面板并拼接 vs 预分配的显示缓冲区"""
+    import cv2
+    import numpy as np
+    from hud import Hud
+
+    frame = np.full((480, 640, 3), 64, dtype=np.uint8)
+    lines = ["Left Stick: (0.00, 0.00)", "Right Stick: (0.00, 0.00)", "Left Trigger: -1.00",
+             "Right Trigger: -1.00", "PTZ Position: (1500, 1500)", "Press ESC to Exit",
+             "Press A for Emergency Stop", "Press B to Fire"]
+
+    def per_frame():
+        panel = np.zeros((480, 320, 3), dtype=np.uint8)
+        y = 30
+        for text in lines:
+            cv2.putText(panel, text, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            y += 30
+        return np.hstack((frame, panel))
+
+    hud = Hud()
+    hud.add_field('left_stick', "Left Stick")
+    hud.add_field('ptz', "PTZ Position")
+    for text in lines[5:]:
+        hud.add_text(text)
+    seq = [0]
+
+    def preallocated():
+        seq[0] += 1
+        hud.set_frame(seq[0], frame)
+        hud.set_field('left_stick', "(0.00, 0.00)")
+        hud.set_field('ptz', "(%d, 1500)" % (1500 + seq[0] % 2))
+        return hud.display
+
+    return {
+        'hud_per_frame_us': timeit(per_frame, n),
+        'hud_preallocated_us': timeit(preallocated, n),
+    }
+
+
+def bench_bus_strategies(n=500, latencies=(0.0001, 0.0005)):
+    """在不同的模拟总线延迟下比较: 4次单电机写入 / 一次4电机写入 / 值不变时省略写入"""
+    from sim import SimBoard
+    results = {}
+    for latency in latencies:
+        board = SimBoard(latency=latency)
+        Board.init(sim.backends(board=board))
+        speeds = [0]
+
+        def per_wheel():
+            speeds[0] = (speeds[0] + 1) % 100
+            for i in range(1, 5):
+                Board.setMotor(i, speeds[0])
+
+        def burst():
+            speeds[0] = (speeds[0] + 1) % 100
+            Board.setMotors([speeds[0]] * 4)
+
+        def parked():
+            Board.setMotors([0, 0, 0, 0])
+
+        key = f"{latency * 1e6:.0f}us"
+        for name, func in (('per_wheel', per_wheel), ('burst', burst), ('parked', parked)):
+            board.reset_stats()
+            results[f'{name}_{key}_us'] = timeit(func, n)
+            results[f'{name}_{key}_transactions'] = board.transactions / n
+    Board.init(sim.backends())
+    return results
+
+
+def bench_kinematics(n=10000, batch=10000):
+    """每条运动命令的计算耗时: 旧的极坐标往返 / 直角坐标 / NumPy批量 / 加速度限制"""
+    import math
+    import numpy as np
+    chassis = MecanumChassis()
+    limiter = SlewLimiter('sport')
+
+    def polar_round_trip(vx, vy, angular_rate):
+        # 旧的 translation -> set_velocity: 先转成极坐标再用 cos/sin 转回来
+        velocity, direction = chassis.translation(vx, vy, fake=True)
+        rad_per_deg = math.pi / 180
+        vx = velocity * math.cos(direction * rad_per_deg)
+        vy = velocity * math.sin(direction * rad_per_deg)
+        vp = -angular_rate * (chassis.a + chassis.b)
+        return int(vy + vx - vp), int(vy - vx + vp), int(vy - vx - vp), int(vy + vx + vp)
+
+    vx = np.random.uniform(-50, 50, batch)
+    vy = np.random.uniform(-50, 50, batch)
+    w = np.random.uniform(-0.5, 0.5, batch)
+    start = time.perf_counter()
+    chassis.wheel_speeds_batch(vx, vy, w)
+    batch_us = (time.perf_counter() - start) / batch * 1e6
+    return {
+        'kinematics_polar_us': timeit(lambda: polar_round_trip(30.0, -20.0, 0.2), n),
+        'kinematics_cartesian_us': timeit(lambda: chassis.wheel_speeds(30.0, -20.0, 0.2), n),
+        'kinematics_batch_us': batch_us,
+        'slew_limiter_us': timeit(lambda: limiter.update((30.0, -20.0, 10.0, 40.0), 0.005), n),
+    }
+
+
+def bench_probe(n=5000):
+    """耗时统计的开销: 关闭 / 开启时的总线写入, 以及 StageStats.time() 本身"""
+    from metrics import StageStats
+    stats = StageStats()
+    disabled = StageStats(enabled=False)
+
+    def timed(s):
+        with s.time('stage'):
+            pass
+
+    Board.init(sim.backends(board=sim.SimBoard(latency=0)))
+    write = lambda: Board.setMotors([50, 50, 50, 50], force=True)
+    results = {'probe_off_write_us': timeit(write, n)}
+    Board.setProbe(stats.record)
+    results['probe_on_write_us'] = timeit(write, n)
+    Board.setProbe(None)
+    results['stage_timer_off_us'] = timeit(lambda: timed(disabled), n)
+    results['stage_timer_on_us'] = timeit(lambda: timed(stats), n)
+    Board.init(sim.backends())
+    return results
+
+
+# Board 导入耗时预算(毫秒)
+IMPORT_BUDGET_MS = 50
+
+def bench_import(repeat=5):
+    """在新的解释器里导入 Board 和 mecanum 的耗时, 导入时不应初始化任何硬件"""
+    import subprocess
+    import sys
+    # 和本文件开头一样, 不让 mecanum 导入树莓派上安装的 HiwonderSDK.Board
+    code = ("import sys, time, types; sys.modules['HiwonderSDK'] = types.ModuleType('HiwonderSDK'); "
+            "t = time.perf_counter(); import Board, mecanum; "
+            "print((time.perf_counter() - t) * 1000)")
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], cwd=cwd,
+                             capture_output=True, text=True, check=True).stdout
+        times.append(float(out))
+    best = min(times)
+    return {
+        'import_ms': best,
+        'import_budget_ms': IMPORT_BUDGET_MS,
+        'import_within_budget': best <= IMPORT_BUDGET_MS,
+    }
+
+
+BENCHMARKS = (bench_import, bench_bus_handle, bench_motor_write, bench_idle_writes, bench_deviation,
+              bench_servo_writes, bench_bus_servo, bench_telemetry, bench_bus_strategies, bench_kinematics, bench_chassis_commands,
+              bench_probe, bench_controller_tick, bench_replay, bench_arduino_link, bench_camera, bench_multiprocess,
+              bench_runtime, bench_hud)
+
+# JSON输出格式的版本, 键名或单位变化时加1
+SCHEMA_VERSION = 1
+
+
+def main(argv=None):
+    import argparse
+    import contextlib
+    import json
+    import platform
+    import sys
+    parser = argparse.ArgumentParser(description="控制栈性能测试(模拟硬件)")
+    parser.add_argument('--json', nargs='?', const='-', metavar='FILE',
+                        help="输出JSON到文件, 不给文件名时输出到标准输出")
+    parser.add_argument('--only', nargs='+', metavar='NAME',
+                        help="只运行指定的测试, 如 controller_tick servo_writes")
+    args = parser.parse_args(argv)
+
+    benches = BENCHMARKS
+    if args.only:
+        names = {name if name.startswith('bench_') else 'bench_' + name for name in args.only}
+        benches = [bench for bench in BENCHMARKS if bench.__name__ in names]
+
+    Board.init(sim.backends())
+    results = {}
+    for bench in benches:
+        # JSON输出到标准输出时, 各模块打印的信息改到标准错误
+        with contextlib.redirect_stdout(sys.stderr if args.json == '-' else sys.stdout):
+            results[bench.__name__[len('bench_'):]] = result = bench()
+        if args.json != '-':
+            for name, value in result.items():
+                print(f"{name}: {value:.1f}" if isinstance(value, float) else f"{name}: {value}")
+
+    if args.json:
+        report = json.dumps({
+            'schema': SCHEMA_VERSION,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results,
+        }, indent=2, sort_keys=True)
+        if args.json == '-':
+            print(report)
+        else:
+            with open(args.json, 'w') as f:
+                f.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# coding=utf8
+"""
+总线舵机(LOBOT协议)的请求层: 带截止时间和有限次重试, 不会因为丢一个回复而卡死
+帧格式: 0x55 0x55 id 长度 命令 参数... 校验和, 长度 = 参数个数 + 3, 校验和 = ~(id + 长度 + 命令 + 参数) & 0xff
+"""
+import time
+from collections import deque
+
+LOBOT_SERVO_FRAME_HEADER         = 0x55
+LOBOT_SERVO_MOVE_TIME_WRITE      = 1
+LOBOT_SERVO_MOVE_TIME_READ       = 2
+LOBOT_SERVO_MOVE_TIME_WAIT_WRITE = 7
+LOBOT_SERVO_MOVE_TIME_WAIT_READ  = 8
+LOBOT_SERVO_MOVE_START           = 11
+LOBOT_SERVO_MOVE_STOP            = 12
+LOBOT_SERVO_ID_WRITE             = 13
+LOBOT_SERVO_ID_READ              = 14
+LOBOT_SERVO_ANGLE_OFFSET_ADJUST  = 17
+LOBOT_SERVO_ANGLE_OFFSET_WRITE   = 18
+LOBOT_SERVO_ANGLE_OFFSET_READ    = 19
+LOBOT_SERVO_ANGLE_LIMIT_WRITE    = 20
+LOBOT_SERVO_ANGLE_LIMIT_READ     = 21
+LOBOT_SERVO_VIN_LIMIT_WRITE      = 22
+LOBOT_SERVO_VIN_LIMIT_READ       = 23
+LOBOT_SERVO_TEMP_MAX_LIMIT_WRITE = 24
+LOBOT_SERVO_TEMP_MAX_LIMIT_READ  = 25
+LOBOT_SERVO_TEMP_READ            = 26
+LOBOT_SERVO_VIN_READ             = 27
+LOBOT_SERVO_POS_READ             = 28
+LOBOT_SERVO_OR_MOTOR_MODE_WRITE  = 29
+LOBOT_SERVO_OR_MOTOR_MODE_READ   = 30
+LOBOT_SERVO_LOAD_OR_UNLOAD_WRITE = 31
+LOBOT_SERVO_LOAD_OR_UNLOAD_READ  = 32
+LOBOT_SERVO_LED_CTRL_WRITE       = 33
+LOBOT_SERVO_LED_CTRL_READ        = 34
+LOBOT_SERVO_LED_ERROR_WRITE      = 35
+LOBOT_SERVO_LED_ERROR_READ       = 36
+
+# 广播id, 总线上只有一个舵机时用来读取它的id
+BROADCAST_ID = 0xfe
+
+# 批量读取时可以用的属性名
+PROPERTIES = {
+    'id': LOBOT_SERVO_ID_READ,
+    'pulse': LOBOT_SERVO_POS_READ,
+    'temp': LOBOT_SERVO_TEMP_READ,
+    'vin': LOBOT_SERVO_VIN_READ,
+    'deviation': LOBOT_SERVO_ANGLE_OFFSET_READ,
+    'angle_limit': LOBOT_SERVO_ANGLE_LIMIT_READ,
+    'vin_limit': LOBOT_SERVO_VIN_LIMIT_READ,
+    'temp_limit': LOBOT_SERVO_TEMP_MAX_LIMIT_READ,
+    'load': LOBOT_SERVO_LOAD_OR_UNLOAD_READ,
+}
+
+def checksum(body):
+    """body: id, 长度, 命令, 参数..."""
+    return ~sum(body) & 0xff
+
+def encode(servo_id, cmd, *params):
+    """
+    生成一帧命令
+    :param params: 每个参数是一个字节(0~255 或 -128~127)
+    """
+    body = [servo_id & 0xff, len(params) + 3, cmd] + [p & 0xff for p in params]
+    return bytes([LOBOT_SERVO_FRAME_HEADER, LOBOT_SERVO_FRAME_HEADER] + body + [checksum(body)])
+
+def encode_write(servo_id, cmd, dat1=None, dat2=None):
+    """
+    写命令, 和原来的 serial_serro_wirte_cmd 相同:
+    只有 dat1 时发送1个字节, 有 dat1 和 dat2 时各发送2个字节(低位在前)
+    """
+    if dat1 is None:
+        return encode(servo_id, cmd)
+    if dat2 is None:
+        return encode(servo_id, cmd, dat1)
+    return encode(servo_id, cmd, dat1, dat1 >> 8, dat2, dat2 >> 8)
+
+def _int16(low, high):
+    value = low | (high << 8)
+    return value - 0x10000 if value & 0x8000 else value
+
+def decode(cmd, params):
+    """
+    解析回复的参数
+    :return: 1个字节时返回整数(偏差为有符号), 2个字节时返回有符号16位整数, 4个字节时返回两个值的元组
+    """
+    if len(params) == 1:
+        value = params[0]
+        if cmd == LOBOT_SERVO_ANGLE_OFFSET_READ and value > 127:
+            value -= 256
+        return value
+    if len(params) == 2:
+        return _int16(params[0], params[1])
+    if len(params) == 4:
+        return _int16(params[0], params[1]), _int16(params[2], params[3])
+    return bytes(params)
+
+class FrameParser:
+    """从串口字节流中解析出完整的帧, 校验和错误或长度错误的帧丢弃并重新找帧头"""
+    def __init__(self):
+        self._buf = bytearray()
+        self.bad_frames = 0
+
+    def feed(self, data):
+        """
+        :return: [(id, 命令, 参数bytes), ...]
+        """
+        buf = self._buf
+        buf += data
+        frames = []
+        while True:
+            start = buf.find(b'\x55\x55')
+            if start < 0:
+                # 最后一个字节可能是下一帧帧头的一半
+                del buf[:-1]
+                break
+            if start:
+                del buf[:start]
+            if len(buf) < 4:
+                break
+            length = buf[3]
+            if length < 3:
+                self.bad_frames += 1
+                del buf[:1]
+                continue
+            if len(buf) < length + 3:
+                break
+            body = buf[2:length + 2]
+            if checksum(body) != buf[length + 2]:
+                self.bad_frames += 1
+                del buf[:1]
+                continue
+            frames.append((body[0], body[2], bytes(body[3:])))
+            del buf[:length + 3]
+        return frames
+
+    def clear(self):
+        self._buf.clear()
+
+class BusServoBus:
+    """
+    总线舵机请求层
+    port: 串口对象(serial.Serial 或 sim.SimServoSerial), 需要 write/read/flush/in_waiting/reset_input_buffer,
+          打开时 timeout 要小(如 0.002s), read() 最多等待这么长时间
+    每个读请求有截止时间 timeout(秒), 超时后重发, 最多重试 retries 次, 仍然没有回复时返回 None
+    window: 同时等待回复的请求数. 舵机总线是半双工的, 真实硬件上应为1(收到回复后立即发下一个请求);
+            设大于1时连续发出多个请求再一起收回复, 只适用于全双工或模拟的总线
+    set_direction: 可选, set_direction(True) 切换到发送, set_direction(False) 切换到接收
+    """
+    def __init__(self, port, timeout=0.05, retries=2, window=1, set_direction=None):
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.window = max(1, window)
+        self.set_direction = set_direction
+        self.stats = {'requests': 0, 'replies': 0, 'retries': 0, 'timeouts': 0}
+        self._parser = FrameParser()
+
+    @property
+    def bad_frames(self):
+        return self._parser.bad_frames
+
+    def _send(self, frame):
+        if self.set_direction is not None:
+            self.set_direction(True)
+        self.port.write(frame)
+        if self.set_direction is not None:
+            self.port.flush()  # 等待发送完成再切换到接收
+            self.set_direction(False)
+
+    def write(self, servo_id, cmd, dat1=None, dat2=None):
+        """发送写命令(没有回复)"""
+        self._send(encode_write(servo_id, cmd, dat1, dat2))
+
+    def request(self, servo_id, cmd, timeout=None, retries=None):
+        """
+        发送一个读命令并等待回复
+        :return: 解析后的值, 超时返回 None
+        """
+        return self.read_many([(servo_id, cmd)], timeout, retries)[0]
+
+    def read_many(self, requests, timeout=None, retries=None):
+        """
+        批量读取, 一个请求的回复到达后立即发出下一个请求
+        :param requests: [(舵机id, 读命令), ...]
+        :return: 和 requests 顺序相同的值的列表, 超时的为 None
+        """
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        results = [None] * len(requests)
+        attempts = [0] * len(requests)
+        pending = deque(range(len(requests)))
+        inflight = {}  # (id, 命令) -> (序号, 截止时间)
+        self.port.reset_input_buffer()
+        self._parser.clear()
+        while pending or inflight:
+            while pending and len(inflight) < self.window:
+                index = pending[0]
+                key = requests[index]
+                if key in inflight:  # 同一个舵机的同一个属性要等上一次的回复
+                    break
+                pending.popleft()
+                attempts[index] += 1
+                self.stats['requests'] += 1
+                self._send(encode(*key))
+                inflight[key] = (index, time.monotonic() + timeout)
+
+            data = self.port.read(max(1, self.port.in_waiting))
+            for servo_id, cmd, params in self._parser.feed(data):
+                entry = inflight.pop((servo_id, cmd), None)
+                if entry is None:
+                    entry = inflight.pop((BROADCAST_ID, cmd), None)
+                if entry is not None:
+                    self.stats['replies'] += 1
+                    results[entry[0]] = decode(cmd, params)
+
+            now = time.monotonic()
+            for key, (index, deadline) in list(inflight.items()):
+                if now >= deadline:
+                    del inflight[key]
+                    if attempts[index] <= retries:
+                        self.stats['retries'] += 1
+                        pending.appendleft(index)
+                    else:
+                        self.stats['timeouts'] += 1
+        return results
+
+    def read_properties(self, ids, properties=('pulse', 'temp', 'vin'), timeout=None, retries=None):
+        """
+        读取多个舵机的多个属性
+        :param properties: PROPERTIES 中的属性名
+        :return: {舵机id: {属性名: 值或None}}
+        """
+        requests = [(servo_id, PROPERTIES[name]) for servo_id in ids for name in properties]
+        values = iter(self.read_many(requests, timeout, retries))
+        return {servo_id: {name: next(values) for name in properties} for servo_id in ids}
+
+    def close(self):
+        self.port.close()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# coding=utf8
+import time
+import threading
+import cv2
+
+class FrameGrabber:
+    """
+    摄像头采集线程, 只保留最新的一帧
+    控制循环调用 read() 取最新帧, 不会等待网络和解码; 没读走的旧帧直接丢弃
+    读取失败时重新打开视频流
+    on_frame: 可选, 每采集到一帧在采集线程里调用 on_frame(seq, frame), 如写入共享内存
+    """
+    def __init__(self, source, reconnect_delay=1.0, on_frame=None):
+        self.source = source
+        self.reconnect_delay = reconnect_delay
+        self.on_frame = on_frame
+        self.frames = 0        # 采集到的帧数
+        self.dropped = 0       # 没被读走就被新帧覆盖的帧数
+        self.errors = 0
+        self.last_error = None
+        self._frame = None
+        self._seq = 0
+        self._read_seq = 0
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+        self._cap = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='camera', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        else:
+            self._release()  # 没有采集线程时由调用 grab() 的一方打开的视频流
+
+    def read(self):
+        """
+        取最新帧, 不阻塞
+        :return: (seq, frame), 还没有帧时返回 (0, None); seq 不变说明没有新帧
+        """
+        with self._lock:
+            self._read_seq = self._seq
+            return self._seq, self._frame
+
+    def _error(self, message):
+        self.errors += 1
+        if message != self.last_error:
+            print(f"摄像头错误: {message}")
+        self.last_error = message
+
+    def grab(self):
+        """
+        采集一帧(阻塞到读到一帧), 采集线程循环调用; 不启动采集线程时可以在执行器里调用
+        :return: 新的一帧, 打开或读取失败时等待 reconnect_delay 秒后返回 None
+        """
+        if self._cap is None:
+            self._cap = cv2.VideoCapture(self.source)
+            if not self._cap.isOpened():
+                self._error(f"无法打开 {self.source}")
+                self._cap.release()
+                self._cap = None
+                time.sleep(self.reconnect_delay)
+                return None
+        try:
+            ret, frame = self._cap.read()
+        except Exception as e:
+            ret, frame = False, None
+            self._error(str(e))
+        if not ret:
+            self._error("读取失败, 重新连接")
+            self._cap.release()
+            self._cap = None
+            time.sleep(self.reconnect_delay)
+            return None
+        with self._lock:
+            if self._seq != self._read_seq:
+                self.dropped += 1
+            self._frame = frame
+            self._seq += 1
+            self.frames += 1
+            seq = self._seq
+        if self.on_frame is not None:
+            self.on_frame(seq, frame)
+        return frame
+
+    def _release(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    def _run(self):
+        while self._running:
+            self.grab()
+        self._release()
@@ -1,63 +1,190 @@
 #!/usr/bin/env python3
 import time
-import serial
 from sys import path
-import glob
 path.append('/home/pi/MasterPi/')
-from HiwonderSDK.Board import setPWMServoPulse, setBuzzer
-from HiwonderSDK.mecanum import MecanumChassis
-from gamepad import Gamepad, XboxButtons, XboxAxes
+try:
+    import HiwonderSDK.Board as Board
+    from HiwonderSDK.mecanum import MecanumChassis
+except ImportError:  # 不在树莓派上时使用同目录下的 mecanum.py
+    import Board
+    from mecanum import MecanumChassis
+from gamepad import Gamepad, GamepadSampler, XboxButtons, XboxAxes
+from gimbal import Gimbal
+from effects import EffectsEngine, FIRE, EMERGENCY_STOP, LOW_BATTERY
+from scheduler import RateScheduler
+from telemetry import BatteryMonitor, LEVEL_OK, SPEED_SCALE
+from arduino import ArduinoLink, PortManager
+from recorder import Recorder
+from metrics import Histogram, StageStats, Reporter, serve_json
+from runtime import Runtime
 
-def find_arduino_port():
-    ports = glob.glob('/dev/ttyACM*') + glob.glob('/dev/ttyUSB*')
-    return ports[0] if ports else None
-
-ARDUINO_PORT = find_arduino_port() or '/dev/ttyUSB0'
+ARDUINO_PORT = None  # 固定的 Arduino 串口, None 时在 /dev/ttyACM* 和 /dev/ttyUSB* 中自动查找
+ARDUINO_HANDSHAKE = None  # Arduino 固件支持握手时设为 (发送的内容, 回复的开头), 如 (b'?\n', b'ok')
 
 # 硬件配置
 SERVO_PAN = 6  # 水平舵机（编号6）
 SERVO_TILT = 5 # 垂直舵机（编号5）
+ARDUINO_HEARTBEAT_S = 1.0  # 没有状态变化时每隔多少秒重发一次当前的发射状态
+ARDUINO_ACK = False  # Arduino 每收到一行会回复一行时设为True, 没有回复时重发
+RECORD_PATH = None  # 设为文件路径时记录每个控制周期, 用 recorder.py 查看和回放
+CONTROL_RATE_HZ = 50  # 控制循环频率，可设为50/100/200
+USE_INPUT_SAMPLER = True  # 高频采样手柄(运行时的手柄任务)，扳机取一个周期内的最大值
+MOTION_PROFILE = 'gentle'  # 轮速加速度限制: 'gentle' / 'sport' / None(不限制)
+ENABLE_METRICS = False  # 统计每个周期各阶段(手柄/底盘/总线/舵机/串口...)的耗时
+METRICS_PORT = 8900  # 开启统计时在 http://127.0.0.1:8900/ 提供JSON, None 不提供
+METRICS_REPORT_S = 10  # 开启统计时每隔多少秒打印一次各阶段耗时, 0 不打印
 
 class GamepadController:
-    def __init__(self):
+    def __init__(self, gamepad=None, arduino=None, use_sampler=USE_INPUT_SAMPLER, record_path=RECORD_PATH,
+                 backends=None):
+        """
+        :param gamepad: 手柄, 默认连接 pygame 手柄; 可以传入 sim.ScriptedGamepad
+        :param arduino: PortManager, 串口路径或串口对象, 默认自动查找; 可以传入 sim.FakeSerial 或 sim.PtyArduino().path
+        :param record_path: 记录文件, None 时不记录
+        :param backends: 传给 Board.init() 的后端, 如 sim.backends(); 用的是底盘和舵机实际使用的 Board 模块
+        """
+        if backends is not None:
+            if not hasattr(Board, 'init'):
+                raise RuntimeError("%s 不支持替换后端, 不能使用模拟硬件" % Board.__name__)
+            Board.init(backends)
+
         # 初始化手柄
-        self.gamepad = Gamepad()
+        self.gamepad = gamepad if gamepad is not None else Gamepad()
+        self.sampler = None
+        if use_sampler:
+            self.sampler = GamepadSampler(self.gamepad)
+        self._peak_since = None  # 上个周期取扳机最大值的时间, 之前的采样已经用过
+
+        # 最近一个周期的摇杆和扳机值 (lx, ly, rx, ry, lt, rt)
+        self.axes = (0.0, 0.0, 0.0, 0.0, -1.0, -1.0)
+
+        # 输入到电机的延迟（从收到手柄事件到写完电机和舵机）
+        self.input_latency = Histogram()
+        self._last_input_time = self.gamepad.state.timestamp
         
         # 初始化麦克纳姆轮底盘
         self.chassis = MecanumChassis()
+        self.chassis.set_profile(MOTION_PROFILE)
+
+        # 本周期的时间, 加速度限制按它计算; 回放时 clock 换成记录的时间, 结果和记录时一致
+        self.clock = time.monotonic
+        self.tick_time = self.clock()
+        if self.chassis.limiter is not None:
+            self.chassis.limiter.clock = lambda: self.tick_time
+        self.recorder = None
+        if record_path is not None:
+            self.recorder = Recorder(record_path, len(self.gamepad.state.axes), CONTROL_RATE_HZ)
         
         # 初始化硬件
-        self.arduino = serial.Serial(ARDUINO_PORT, 115200, timeout=0.1)
+        # 发射通道只在状态变化时发送, 由后台线程写串口; 断开后在后台线程里重新查找和连接
+        if arduino is None:
+            handshake, expect = ARDUINO_HANDSHAKE or (None, b'')
+            arduino = PortManager(ARDUINO_PORT, handshake=handshake, expect=expect,
+                                  settle=2.0 if handshake else 0.0)
+        self.arduino = ArduinoLink(arduino, heartbeat=ARDUINO_HEARTBEAT_S, ack=ARDUINO_ACK)
         self.chassis.reset_motors()
         
         # 初始化舵机位置
-        self.servo5_pulse = 1500
-        self.servo6_pulse = 1500
-        setPWMServoPulse(SERVO_TILT, self.servo5_pulse, 1000)
-        setPWMServoPulse(SERVO_PAN, self.servo6_pulse, 1000)
+        self.gimbal = Gimbal(SERVO_PAN, SERVO_TILT)
+        self.gimbal.center()
+        self.gimbal.flush(1000, force=True)
+        self.flush_servos = True
         time.sleep(1)
 
+        # 蜂鸣器和RGB灯效在后台播放，不阻塞控制循环
+        self.effects = EffectsEngine()
+        self.effects.start()
+
+        # 电池电压在后台线程里读取, 控制循环只读缓存的值; 电量低时报警并限速
+        self.battery = BatteryMonitor(on_event=self.on_battery_event)
+
+        # 固定频率调度
+        self.scheduler = RateScheduler(CONTROL_RATE_HZ)
+
+        # 各阶段耗时统计, 关闭时 time() 什么都不做, 各模块的回调也不设置
+        self.metrics = StageStats(enabled=ENABLE_METRICS)
+        self.metrics_server = None
+        self.metrics_reporter = None
+        if ENABLE_METRICS:
+            Board.setProbe(self.metrics.record)
+            self.chassis.probe = self.metrics.record
+            self.gamepad.probe = self.metrics.record
+            self.arduino.probe = self.metrics.record
+            if METRICS_PORT is not None:
+                self.metrics_server = serve_json(self.metrics_snapshot, METRICS_PORT)
+            if METRICS_REPORT_S:
+                self.metrics_reporter = Reporter(self.metrics.summary, METRICS_REPORT_S)
+                self.metrics_reporter.start()
+
+    def start(self):
+        """
+        启动 Arduino 串口, 电池遥测的后台线程, 用于直接循环调用 tick() 的场合;
+        control_loop() 不需要调用, 这些由 runtime 的任务负责
+        手柄采样器不启动单独的线程(SDL 事件只能在主线程里处理, 采样线程只会读到上一周期的状态),
+        由 tick() 在 update() 之后采样; runtime 的手柄任务每次处理事件后采样
+        """
+        self.arduino.start()
+        self.battery.start()
+
+    def metrics_snapshot(self):
+        """各阶段耗时, 循环周期, 总线传输数和输入延迟"""
+        return {
+            'stages': self.metrics.snapshot(),
+            'scheduler': self.scheduler.stats(),
+            'bus': Board.getBusStats(),
+            'input_latency': self.input_latency.snapshot(),
+            'battery_mv': self.battery.voltage,
+            'arduino': self.arduino.snapshot(),
+        }
+
+    def stop_metrics(self):
+        Board.setProbe(None)
+        if self.metrics_reporter is not None:
+            self.metrics_reporter.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+        if ENABLE_METRICS:
+            print(self.metrics.summary())
+
+    def on_battery_event(self, level, voltage):
+        """电量等级变化(在电池监视线程里调用)"""
+        print(f"电池电压 {voltage / 1000:.2f}V, 等级: {level}")
+        if level != LEVEL_OK:
+            self.effects.play(LOW_BATTERY)
+
+    def record_tick(self, state, lt, rt, battery_level):
+        """记录本周期的输入(扳机为实际使用的值, 限速用的电量等级)和输出"""
+        axes = list(state.axes)
+        axes[XboxAxes.LEFT_TRIGGER] = lt
+        axes[XboxAxes.RIGHT_TRIGGER] = rt
+        self.recorder.record(self.tick_time, axes, state.buttons, state.pressed, state.released,
+                             self.chassis.speeds, self.gimbal.pan, self.gimbal.tilt, self.arduino.fire,
+                             battery_level)
+
     def map_axis(self, value, deadzone=0.1):
         """摇杆轴值处理（带死区）"""
         if abs(value) < deadzone:
             return 0.0
         return round(value, 2)
 
-    def control_chassis(self, x, y, turn_rate):
+    def control_chassis(self, x, y, turn_rate, battery_level=LEVEL_OK):
         """麦克纳姆轮移动控制（包含转向）"""
         max_speed = 50  # 降低最大速度方便测试
         max_turn = 50   # 降低最大转向速度
         
-        # 使用translation方法控制移动，反转y轴方向
+        # 电量低时按比例限速(读缓存的电压, 不访问总线)
+        scale = SPEED_SCALE[battery_level]
+        max_speed *= scale
+        turn_rate *= scale
+        
         vx = x * max_speed
         vy = -y * max_speed  # 反转Y轴方向
-        turn = turn_rate * max_turn
+        if abs(turn_rate * max_turn) <= 0.1:  # 转向太小时忽略
+            turn_rate = 0
         
         try:
-            if abs(turn) > 0.1:  # 如果有转向，使用set_velocity
-                self.chassis.set_velocity(0, 0, turn/max_turn)  # 归一化转向速度
-            else:  # 没有转向，使用translation进行平移
-                self.chassis.translation(vx, vy)
+            # 平移和转向合成一条命令，轮速超出范围时按比例缩小
+            self.chassis.move(vx, vy, turn_rate)
         except Exception as e:
             print(f"底盘控制错误: {e}")
             self.chassis.reset_motors()
@@ -68,85 +195,113 @@ class GamepadController:
         
         # 水平方向控制6号舵机（反转方向）
         if abs(rx) > 0.1:
-            self.servo6_pulse -= int(rx * servo_speed)  # 反转方向
-            self.servo6_pulse = max(500, min(2500, self.servo6_pulse))
-            setPWMServoPulse(SERVO_PAN, self.servo6_pulse, 20)
+            self.gimbal.move(d_pan=-int(rx * servo_speed))  # 反转方向
         
         # 垂直方向控制5号舵机（反转方向）
         if abs(ry) > 0.1:
-            self.servo5_pulse -= int(ry * servo_speed)  # 反转方向
-            self.servo5_pulse = max(500, min(2500, self.servo5_pulse))
-            setPWMServoPulse(SERVO_TILT, self.servo5_pulse, 20)
+            self.gimbal.move(d_tilt=-int(ry * servo_speed))  # 反转方向
 
-    def control_loop(self):
-        try:
-            print("\n开始主循环...")
-            
-            while True:
-                # 更新手柄状态
-                self.gamepad.update()
-                
-                # 读取摇杆值
-                lx = self.map_axis(self.gamepad.get_axis(XboxAxes.LEFT_X))
-                ly = self.map_axis(self.gamepad.get_axis(XboxAxes.LEFT_Y))
-                rx = self.map_axis(self.gamepad.get_axis(XboxAxes.RIGHT_X))
-                ry = self.map_axis(self.gamepad.get_axis(XboxAxes.RIGHT_Y))
-                
-                # 读取扳机值（用于转向）
-                lt = self.gamepad.get_axis(XboxAxes.LEFT_TRIGGER)
-                rt = self.gamepad.get_axis(XboxAxes.RIGHT_TRIGGER)
-                
-                # 计算转向值
-                turn_rate = 0
-                if lt > -0.9:  # 左扳机按下，左转
-                    lt_value = self.gamepad.format_trigger_value(lt) / 100.0
-                    turn_rate = -lt_value
-                if rt > -0.9:  # 右扳机按下，右转
-                    rt_value = self.gamepad.format_trigger_value(rt) / 100.0
-                    turn_rate = rt_value
-                
-                # 控制底盘移动和转向
-                if abs(lx) > 0.1 or abs(ly) > 0.1 or abs(turn_rate) > 0.1:
-                    self.control_chassis(lx, ly, turn_rate)
-                else:
-                    self.chassis.reset_motors()
-                
-                # 控制云台舵机
-                self.control_servos(rx, ry)
-                
-                # 处理按钮
-                if self.gamepad.get_button(XboxButtons.B):  # B键控制发射
-                    self.arduino.write(b'1\n')
-                    setBuzzer(1)
-                    time.sleep(0.05)
-                    setBuzzer(0)
-                else:
-                    self.arduino.write(b'0\n')
-                
-                if self.gamepad.get_button(XboxButtons.A):  # A键紧急停止
-                    print("紧急停止")
-                    self.chassis.reset_motors()
-                    self.arduino.write(b'0\n')
-                    setBuzzer(1)
-                    time.sleep(0.2)
-                    setBuzzer(0)
-                    self.servo5_pulse = 1500
-                    self.servo6_pulse = 1500
-                    setPWMServoPulse(SERVO_TILT, self.servo5_pulse, 1000)
-                    setPWMServoPulse(SERVO_PAN, self.servo6_pulse, 1000)
-                
-                time.sleep(0.02)  # 50Hz更新率
+        # 两个舵机合并成一帧发送, 没有变化时不发送; 在 runtime 里运行时由云台任务发送
+        if self.flush_servos:
+            with self.metrics.time('servos'):
+                self.gimbal.flush(20)
 
-        except Exception as e:
-            print(f"发生错误: {e}")
-            import traceback
-            traceback.print_exc()
-        finally:
-            print("正在退出...")
+    def tick(self, state=None, battery_level=None):
+        """
+        一个控制周期
+        :param state: 本周期的手柄状态, None 时调用 gamepad.update() 处理手柄事件(只能在主线程里);
+                      runtime 在事件循环线程里处理事件, 把 gamepad.snapshot() 传进来
+        :param battery_level: 限速用的电量等级, None 时取电池监视器当前的等级(回放时传入记录的等级)
+        """
+        if battery_level is None:
+            battery_level = self.battery.level
+        # 更新手柄状态
+        if state is None:
+            state = self.gamepad.update()
+            if self.sampler is not None:
+                self.sampler.sample()
+        self.tick_time = self.clock()
+        
+        # 读取摇杆值
+        lx = self.map_axis(state.axis(XboxAxes.LEFT_X))
+        ly = self.map_axis(state.axis(XboxAxes.LEFT_Y))
+        rx = self.map_axis(state.axis(XboxAxes.RIGHT_X))
+        ry = self.map_axis(state.axis(XboxAxes.RIGHT_Y))
+        
+        # 读取扳机值（用于转向）
+        lt = state.axis(XboxAxes.LEFT_TRIGGER)
+        rt = state.axis(XboxAxes.RIGHT_TRIGGER)
+        if self.sampler is not None:  # 取上个周期之后(包括本周期的状态)的最大值，快速按一下扳机也不会丢
+            since, self._peak_since = self._peak_since, time.monotonic()
+            peak = self.sampler.filtered(1000.0 / CONTROL_RATE_HZ, 'max', since)
+            if peak is not None:  # 还没有采样时只用本周期的状态
+                lt = max(lt, peak[XboxAxes.LEFT_TRIGGER])
+                rt = max(rt, peak[XboxAxes.RIGHT_TRIGGER])
+        
+        # 计算转向值
+        turn_rate = 0
+        if lt > -0.9:  # 左扳机按下，左转
+            lt_value = self.gamepad.format_trigger_value(lt) / 100.0
+            turn_rate = -lt_value
+        if rt > -0.9:  # 右扳机按下，右转
+            rt_value = self.gamepad.format_trigger_value(rt) / 100.0
+            turn_rate = rt_value
+        
+        # 控制底盘移动和转向
+        if abs(lx) > 0.1 or abs(ly) > 0.1 or abs(turn_rate) > 0.1:
+            self.control_chassis(lx, ly, turn_rate, battery_level)
+        else:
+            self.chassis.move(0, 0, 0)  # 松开摇杆时按加速度限制减速停下
+        
+        # 控制云台舵机
+        self.control_servos(rx, ry)
+
+        # 有新输入时记录输入到电机的延迟
+        if state.timestamp != self._last_input_time:
+            self._last_input_time = state.timestamp
+            self.input_latency.record(time.monotonic() - state.timestamp)
+        
+        # 处理按钮
+        if state.was_pressed(XboxButtons.B):  # B键控制发射，按下时发送1
+            self.arduino.set_fire(True)
+            self.effects.play(FIRE)
+        # 松开按钮时发送0; 周期内松开又按下时按周期末的状态, 仍然按着就不停止
+        if state.was_released(XboxButtons.B) and not state.button(XboxButtons.B):
+            self.arduino.set_fire(False)
+        
+        # A键紧急停止, 两个周期之间按下又松开的短按也算
+        if state.button(XboxButtons.A) or state.was_pressed(XboxButtons.A):
+            print("紧急停止")
             self.chassis.reset_motors()
-            self.arduino.write(b'0\n')
-            self.arduino.close()
-            self.gamepad.close()
+            self.arduino.set_fire(False)
+            self.effects.play(EMERGENCY_STOP)
+            self.gimbal.center()
+            self.gimbal.flush(1000)
+
+        # 记录本周期
+        if self.recorder is not None:
+            self.record_tick(state, lt, rt, battery_level)
+
+        # 保存本周期的输入, 多进程模式下发布给界面进程
+        self.axes = (lx, ly, rx, ry, lt, rt)
+
+    def close(self):
+        """停车并停止各后台线程, 关闭串口和手柄"""
+        self.stop_metrics()
+        self.battery.stop()
+        self.chassis.reset_motors()
+        self.arduino.close()  # 先发送停止再关闭
+        self.effects.stop()
+        if self.sampler is not None:
+            self.sampler.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.gamepad.close()
+
+    def control_loop(self):
+        """在 asyncio 运行时上运行, 直到 Ctrl+C, 退出时停车并关闭"""
+        print("\n开始主循环...")
+        Runtime(self).run()
 
 if __name__ == '__main__':
     controller = GamepadController()
@@ -1,230 +1,263 @@
 #!/usr/bin/env python3
 import time
-import serial
 import cv2
-import numpy as np
-from sys import path
-import glob
-path.append('/home/pi/MasterPi/')
-from HiwonderSDK.Board import setPWMServoPulse, setBuzzer
-from HiwonderSDK.mecanum import MecanumChassis
-from gamepad import Gamepad, XboxButtons, XboxAxes
-
-def find_arduino_port():
-    ports = glob.glob('/dev/ttyACM*') + glob.glob('/dev/ttyUSB*')
-    return ports[0] if ports else None
-
-ARDUINO_PORT = find_arduino_port() or '/dev/ttyUSB0'
-
-# 硬件配置
-SERVO_PAN = 6  # 水平舵机（编号6）
-SERVO_TILT = 5 # 垂直舵机（编号5）
-
-class GamepadController:
-    def __init__(self):
-        # 初始化手柄
-        self.gamepad = Gamepad()
-        
-        # 初始化麦克纳姆轮底盘
-        self.chassis = MecanumChassis()
-        
-        # 初始化硬件
-        self.arduino = serial.Serial(ARDUINO_PORT, 115200, timeout=0.1)
-        self.chassis.reset_motors()
-        
-        # 初始化舵机位置
-        self.servo5_pulse = 1500
-        self.servo6_pulse = 1500
-        setPWMServoPulse(SERVO_TILT, self.servo5_pulse, 1000)
-        setPWMServoPulse(SERVO_PAN, self.servo6_pulse, 1000)
-        time.sleep(1)
-
-        # 初始化摄像头
-        self.cap = cv2.VideoCapture('http://127.0.0.1:8080?action=stream')
-        
-        # 添加发射按钮状态追踪
-        self.b_button_pressed = False
-        
+import car_control_pygame
+from camera import FrameGrabber
+from hud import Hud
+from scheduler import RateScheduler
+from shared import SharedState, FrameRing
+from runtime import Runtime
+
+# 控制相关的配置(舵机编号, Arduino 串口, 控制频率, 加速度限制, 统计...)在 car_control_pygame.py
+CAMERA_URL = 'http://127.0.0.1:8080?action=stream'
+MULTIPROCESS = False  # 控制循环, 摄像头采集和界面分别在单独的进程里运行, 通过共享内存交换状态和画面
+UI_RATE_HZ = 30  # 界面的刷新频率, 控制循环单独按 car_control_pygame.CONTROL_RATE_HZ 运行
+
+def create_hud():
+    """显示画面（左边摄像头，右边参数）"""
+    hud = Hud()
+    hud.add_field('mouse', "Mouse Position")
+    hud.add_field('left_stick', "Left Stick")
+    hud.add_field('right_stick', "Right Stick")
+    hud.add_field('lt', "Left Trigger")
+    hud.add_field('rt', "Right Trigger")
+    hud.add_field('ptz', "PTZ Position")
+    hud.add_field('battery', "Battery")
+    hud.add_field('arduino', "Arduino")
+    hud.add_field('control', "Ctrl p99")
+    hud.add_text("Press ESC to Exit")
+    hud.add_text("Press A for Emergency Stop")
+    hud.add_text("Press B to Fire")
+    return hud
+
+def format_control(period_p99, overruns):
+    """控制周期的p99和超时次数, 用于显示(信息面板只有320像素宽)"""
+    return f"{period_p99 * 1000:.1f}ms/{overruns}ovr"
+
+def update_hud(hud, control, mouse, battery=None):
+    """
+    按控制状态更新信息面板, 只重画变化了的数值
+    :param control: shared.ControlState, 还没有控制周期时为 None
+    :param battery: (电压, 等级), None 时用 control 里的电压
+    """
+    hud.set_field('mouse', f"({mouse[0]}, {mouse[1]})")
+    if control is None:
+        return
+    lx, ly, rx, ry, lt, rt = control.axes
+    hud.set_field('left_stick', f"({lx:.2f}, {ly:.2f})")
+    hud.set_field('right_stick', f"({rx:.2f}, {ry:.2f})")
+    hud.set_field('lt', f"{lt:.2f}")
+    hud.set_field('rt', f"{rt:.2f}")
+    hud.set_field('ptz', f"({control.pan}, {control.tilt})")
+    if battery is not None:
+        hud.set_field('battery', f"{battery[0] / 1000:.2f}V {battery[1]}")
+    else:
+        hud.set_field('battery', f"{control.battery_mv / 1000:.2f}V" if control.battery_mv else "--")
+    hud.set_field('arduino', "connected" if control.arduino_connected else "reconnecting")
+    hud.set_field('control', format_control(control.period_p99, control.overruns))
+
+class GamepadController(car_control_pygame.GamepadController):
+    """
+    带摄像头画面和信息面板的控制器, 控制部分(tick, 底盘, 云台, 发射, 统计, 记录)和 car_control_pygame 的相同
+    这里只增加摄像头, 显示画面和界面任务
+    """
+    def __init__(self, *args, **kwargs):
+        """参数和 car_control_pygame.GamepadController 相同"""
+        super().__init__(*args, **kwargs)
+
+        # 初始化摄像头，在单独的线程里采集解码，界面只取最新帧
+        self.camera = FrameGrabber(CAMERA_URL)
+
         # 添加鼠标位置追踪
         self.mouse_x = 0
         self.mouse_y = 0
 
-    def map_axis(self, value, deadzone=0.1):
-        """摇杆轴值处理（带死区）"""
-        if abs(value) < deadzone:
-            return 0.0
-        return round(value, 2)
+        # 显示画面（左边摄像头，右边参数）
+        self.hud = create_hud()
 
-    def control_chassis(self, x, y, turn_rate):
-        """麦克纳姆轮移动控制（包含转向）"""
-        max_speed = 50  # 降低最大速度方便测试
-        max_turn = 50   # 降低最大转向速度
-        
-        # 使用translation方法控制移动，反转y轴方向
-        vx = x * max_speed
-        vy = -y * max_speed  # 反转Y轴方向
-        turn = turn_rate * max_turn
-        
-        try:
-            if abs(turn) > 0.1:  # 如果有转向，使用set_velocity
-                self.chassis.set_velocity(0, 0, turn/max_turn)  # 归一化转向速度
-            else:  # 没有转向，使用translation进行平移
-                self.chassis.translation(vx, vy)
-        except Exception as e:
-            self.chassis.reset_motors()
-
-    def control_servos(self, rx, ry):
-        """云台舵机控制"""
-        servo_speed = 10  # 舵机移动速度
-        
-        # 水平方向控制6号舵机（反转方向）
-        if abs(rx) > 0.1:
-            self.servo6_pulse -= int(rx * servo_speed)  # 反转方向
-            self.servo6_pulse = max(500, min(2500, self.servo6_pulse))
-            setPWMServoPulse(SERVO_PAN, self.servo6_pulse, 20)
-        
-        # 垂直方向控制5号舵机（反转方向）
-        if abs(ry) > 0.1:
-            self.servo5_pulse -= int(ry * servo_speed)  # 反转方向
-            self.servo5_pulse = max(500, min(2500, self.servo5_pulse))
-            setPWMServoPulse(SERVO_TILT, self.servo5_pulse, 20)
+    def start(self):
+        """启动各后台线程和摄像头采集线程, 用于直接循环调用 tick() 的场合"""
+        super().start()
+        self.camera.start()
 
     def mouse_callback(self, event, x, y, flags, param):
         """鼠标事件回调函数"""
         self.mouse_x = x
         self.mouse_y = y
 
-    def create_debug_frame(self):
-        """创建调试帧，用于在摄像头不可用时显示"""
-        frame = np.zeros((480, 640, 3), dtype=np.uint8)
-        cv2.putText(frame, "Camera Disconnected", (180, 240),
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        return frame
+    def render(self, control, seq, frame, battery=None):
+        """
+        显示摄像头画面和控制状态, 按ESC时返回False
+        :param control: 最近一个控制周期的 ControlState
+        :param seq: 帧序号, 和上次相同时不重画画面
+        """
+        # 显示摄像头最新画面（没有新帧时不重画）
+        with self.metrics.time('camera'):
+            self.hud.set_frame(seq, frame)
 
-    def control_loop(self):
+        # 只重画变化了的数值
+        with self.metrics.time('hud'):
+            update_hud(self.hud, control, (self.mouse_x, self.mouse_y), battery)
+        
+        # 显示画面, 按ESC退出
+        with self.metrics.time('display'):
+            cv2.imshow('Robot Control', self.hud.display)
+            key = cv2.waitKey(1)
+        if key == 27:  # ESC
+            return False
+        return True
+
+    def create_window(self):
         cv2.namedWindow('Robot Control', cv2.WINDOW_NORMAL)
         cv2.resizeWindow('Robot Control', 960, 480)  # 增加窗口宽度以容纳参数显示
         cv2.setMouseCallback('Robot Control', self.mouse_callback)  # 设置鼠标回调
-        
-        while True:
-            try:
-                # 更新手柄状态
-                self.gamepad.update()
-                
-                # 读取摇杆值
-                lx = self.map_axis(self.gamepad.get_axis(XboxAxes.LEFT_X))
-                ly = self.map_axis(self.gamepad.get_axis(XboxAxes.LEFT_Y))
-                rx = self.map_axis(self.gamepad.get_axis(XboxAxes.RIGHT_X))
-                ry = self.map_axis(self.gamepad.get_axis(XboxAxes.RIGHT_Y))
-                
-                # 读取扳机值（用于转向）
-                lt = self.gamepad.get_axis(XboxAxes.LEFT_TRIGGER)
-                rt = self.gamepad.get_axis(XboxAxes.RIGHT_TRIGGER)
-                
-                # 计算转向值
-                turn_rate = 0
-                if lt > -0.9:  # 左扳机按下，左转
-                    lt_value = self.gamepad.format_trigger_value(lt) / 100.0
-                    turn_rate = -lt_value
-                if rt > -0.9:  # 右扳机按下，右转
-                    rt_value = self.gamepad.format_trigger_value(rt) / 100.0
-                    turn_rate = rt_value
-                
-                # 控制底盘移动和转向
-                if abs(lx) > 0.1 or abs(ly) > 0.1 or abs(turn_rate) > 0.1:
-                    self.control_chassis(lx, ly, turn_rate)
-                else:
-                    self.chassis.reset_motors()
-                
-                # 控制云台舵机
-                self.control_servos(rx, ry)
-                
-                # 处理按钮
-                if self.gamepad.get_button(XboxButtons.B):  # B键控制发射
-                    if not self.b_button_pressed:  # 只在第一次按下时发送1
-                        self.arduino.write(b'1\n')
-                        setBuzzer(1)
-                        time.sleep(0.05)
-                        setBuzzer(0)
-                        self.b_button_pressed = True
-                else:
-                    if self.b_button_pressed:  # 松开按钮时发送0
-                        self.arduino.write(b'0\n')
-                        self.b_button_pressed = False
-                
-                if self.gamepad.get_button(XboxButtons.A):  # A键紧急停止
-                    self.chassis.reset_motors()
-                    self.arduino.write(b'0\n')
-                    setBuzzer(1)
-                    time.sleep(0.2)
-                    setBuzzer(0)
-                    self.servo5_pulse = 1500
-                    self.servo6_pulse = 1500
-                    setPWMServoPulse(SERVO_TILT, self.servo5_pulse, 1000)
-                    setPWMServoPulse(SERVO_PAN, self.servo6_pulse, 1000)
-
-                # 读取并显示摄像头画面
-                ret, frame = self.cap.read()
-                if not ret:
-                    frame = self.create_debug_frame()
-
-                # 在画面上画准心
-                center = (264, 386)
-                size = 20  # 准心大小
-                color = (0, 255, 0)  # 绿色
-                thickness = 2
-                # 画十字准心
-                cv2.line(frame, (center[0] - size, center[1]), (center[0] + size, center[1]), color, thickness)  # 水平线
-                cv2.line(frame, (center[0], center[1] - size), (center[0], center[1] + size), color, thickness)  # 垂直线
-
-                # 创建信息显示区域
-                info_panel = np.zeros((480, 320, 3), dtype=np.uint8)
-                
-                # 准备显示信息
-                info_text = [
-                    f"Mouse Position: ({self.mouse_x}, {self.mouse_y})",
-                    f"Left Stick: ({lx:.2f}, {ly:.2f})",
-                    f"Right Stick: ({rx:.2f}, {ry:.2f})",
-                    f"Left Trigger: {lt:.2f}",
-                    f"Right Trigger: {rt:.2f}",
-                    f"PTZ Position: ({self.servo6_pulse}, {self.servo5_pulse})",
-                    "Press ESC to Exit",
-                    "Press A for Emergency Stop",
-                    "Press B to Fire"
-                ]
-                
-                # 在信息面板上显示文本
-                y = 30
-                for text in info_text:
-                    cv2.putText(info_panel, text, (10, y), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.7, 
-                              (0, 255, 0), 2)
-                    y += 30
-                
-                # 合并摄像头画面和信息面板
-                display = np.hstack((frame, info_panel))
-                
-                # 显示画面
-                cv2.imshow('Robot Control', display)
-                
-                # 按ESC退出
-                key = cv2.waitKey(1)
-                if key == 27:  # ESC
-                    break
-
-            except Exception:
-                pass
-            
-            time.sleep(0.02)  # 50Hz更新率
-
-        # 清理资源
-        self.chassis.reset_motors()
-        self.arduino.write(b'0\n')
-        self.arduino.close()
-        self.gamepad.close()
-        self.cap.release()
-        cv2.destroyAllWindows()
+
+    async def ui_task(self, runtime):
+        """
+        界面任务: 按 UI_RATE_HZ 显示通道里最新的画面和控制状态, 按ESC时结束(运行时随之停止)
+        建窗口, 画图和 waitKey 都在单独的 'ui' 执行器线程里, 不阻塞事件循环上的控制周期
+        """
+        ui = runtime.executor('ui')
+        scheduler = RateScheduler(UI_RATE_HZ)
+        control = runtime.channels['control']
+        frames = runtime.channels['frame']
+        battery = runtime.channels['battery']
+        await runtime.run_in(ui, self.create_window)
+        try:
+            while await runtime.run_in(ui, self.render, control.value, frames.seq, frames.value, battery.value):
+                await scheduler.wait_async()
+        finally:
+            await runtime.run_in(ui, cv2.destroyAllWindows)
+
+    def control_loop(self):
+        """在 asyncio 运行时上运行: 控制周期, 摄像头和界面是同一个事件循环上的任务, 按ESC退出"""
+        runtime = Runtime(self)
+        runtime.add_task('ui', self.ui_task)
+        runtime.run()  # 退出时停车并关闭各硬件
+
+    def close(self):
+        """停车并停止各后台线程, 关闭串口, 手柄和摄像头"""
+        super().close()
+        self.camera.stop()
+
+def run_control(state_name, make_controller=None):
+    """
+    控制进程: 在 asyncio 运行时上运行没有界面的控制器, 每个周期把状态写入共享内存, 界面请求停止时退出
+    :param make_controller: 无参数函数, 返回没有界面的控制器, 默认 car_control_pygame.GamepadController
+    """
+    if make_controller is None:
+        make_controller = car_control_pygame.GamepadController
+    state = SharedState(state_name)
+    runtime = Runtime(make_controller())
+
+    async def publish(runtime):
+        channel = runtime.channels['control']
+        seq = 0
+        while not state.stop_requested:
+            seq, control = await channel.wait(seq)
+            state.publish(control)
+
+    runtime.add_task('publish', publish)
+    try:
+        runtime.run()
+    finally:
+        state.close()
+
+def run_camera(ring_name, state_name, url=CAMERA_URL):
+    """摄像头进程: 采集并解码视频流, 每一帧写入共享内存的环形缓冲区, 界面请求停止时退出"""
+    import numpy as np
+    state = SharedState(state_name)
+    ring = FrameRing(name=ring_name)
+    height, width = ring.shape[:2]
+    resized = np.empty(ring.shape, dtype=np.uint8)
+
+    def on_frame(seq, frame):
+        if frame.shape != ring.shape:
+            frame = cv2.resize(frame, (width, height), dst=resized)
+        ring.write(frame)
+
+    camera = FrameGrabber(url, on_frame=on_frame)
+    camera.start()
+    try:
+        while not state.stop_requested:
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        camera.stop()
+        ring.close()
+        state.close()
+
+def run_multiprocess(camera_url=CAMERA_URL, make_controller=None, show=True, seconds=None):
+    """
+    多进程模式: 控制进程和摄像头进程各自运行, 本进程只从共享内存读取状态和画面, 画界面
+    控制周期不和视频解码, 画图, 显示争用同一个 GIL
+    :param show: False 时不打开窗口(测试用)
+    :param seconds: 控制进程发布第一个状态后再运行多少秒退出(不算控制器初始化的时间), None 时一直运行到按ESC
+    :return: 退出前控制进程最后发布的状态 ControlState
+    """
+    import multiprocessing
+    import numpy as np
+    context = multiprocessing.get_context('spawn')  # 子进程不继承本进程的线程和窗口
+    state = SharedState()
+    ring = FrameRing()
+    processes = [
+        context.Process(target=run_control, args=(state.name, make_controller), name='control'),
+        context.Process(target=run_camera, args=(ring.name, state.name, camera_url), name='camera'),
+    ]
+    for process in processes:
+        process.start()
+
+    hud = create_hud()
+    frame = np.empty(ring.shape, dtype=np.uint8)
+    mouse = [0, 0]
+    if show:
+        def mouse_callback(event, x, y, flags, param):
+            mouse[:] = x, y
+        cv2.namedWindow('Robot Control', cv2.WINDOW_NORMAL)
+        cv2.resizeWindow('Robot Control', 960, 480)
+        cv2.setMouseCallback('Robot Control', mouse_callback)
+
+    scheduler = RateScheduler(UI_RATE_HZ)
+    end = None
+    last = None
+
+    def update():
+        nonlocal last, end
+        seq = ring.read(frame)
+        hud.set_frame(seq, frame if seq else None)
+        last = state.read() or last
+        update_hud(hud, last, mouse)
+        if end is None and seconds is not None and last is not None:
+            end = time.monotonic() + seconds
+        if show:
+            cv2.imshow('Robot Control', hud.display)
+            if cv2.waitKey(1) == 27:  # ESC
+                return False
+        if end is not None and time.monotonic() >= end:
+            return False
+        # 控制进程异常退出时界面也退出
+        return processes[0].is_alive()
+
+    try:
+        scheduler.run(update)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state.request_stop()
+        for process in processes:
+            process.join()
+        last = state.read() or last
+        if show:
+            cv2.destroyAllWindows()
+        print(f"界面: {scheduler.summary()}")
+        ring.close()
+        state.close()
+    return last
 
 if __name__ == '__main__':
-    controller = GamepadController()
-    controller.control_loop() 
\ No newline at end of file
+    if MULTIPROCESS:
+        run_multiprocess()
+    else:
+        controller = GamepadController()
+        controller.control_loop() 
\ No newline at end of file
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# coding=utf8
+"""
+蜂鸣器和RGB灯效, 在后台线程里按时间播放, 控制线程调用 play() 后立即返回
+"""
+import time
+import threading
+from sys import path
+path.append('/home/pi/MasterPi/')
+try:
+    import HiwonderSDK.Board as Board
+except ImportError:  # 不在树莓派上时使用同目录下的 Board.py
+    import Board
+
+# 优先级, 数值大的可以打断数值小的
+PRIORITY_FIRE = 1
+PRIORITY_BATTERY = 5
+PRIORITY_EMERGENCY = 10
+
+class Effect:
+    """
+    一段灯效
+    steps: [(蜂鸣器 0/1, RGB颜色 (r, g, b) 或 None表示不改变, 持续时间s), ...]
+    """
+    def __init__(self, name, steps, priority=0):
+        self.name = name
+        self.steps = tuple(steps)
+        self.priority = priority
+
+# 发射: 短响一声, 灯闪红色
+FIRE = Effect('fire', [(1, (255, 0, 0), 0.05)], PRIORITY_FIRE)
+# 紧急停止: 长响一声, 灯亮黄色
+EMERGENCY_STOP = Effect('emergency_stop', [(1, (255, 160, 0), 0.2)], PRIORITY_EMERGENCY)
+# 电量低: 响两声, 灯闪紫色
+LOW_BATTERY = Effect('low_battery', [(1, (160, 0, 255), 0.1), (0, (0, 0, 0), 0.1),
+                                     (1, (160, 0, 255), 0.1)], PRIORITY_BATTERY)
+
+def _board_buzzer(state):
+    Board.setBuzzer(state)
+
+def _board_rgb(color):
+    rgb = Board.RGB
+    for i in range(rgb.numPixels()):
+        rgb.setPixelColor(i, Board.PixelColor(*color))
+    rgb.show()
+
+class EffectsEngine:
+    """
+    灯效引擎, 同一时间只播放一段灯效
+    优先级相同或更高的灯效会打断正在播放的, 优先级更低的会被忽略
+    每段灯效结束(或被取消)后关闭蜂鸣器和RGB灯
+    """
+    def __init__(self, set_buzzer=_board_buzzer, set_rgb=_board_rgb):
+        self._set_buzzer = set_buzzer
+        self._set_rgb = set_rgb
+        self._cond = threading.Condition()
+        self._current = None
+        self._step = 0
+        self._step_end = 0.0
+        self._restart = False
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='effects', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程并关闭蜂鸣器和灯"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def play(self, effect):
+        """
+        播放一段灯效, 不阻塞
+        :return: 是否被接受(正在播放更高优先级的灯效时返回False)
+        """
+        with self._cond:
+            if self._current is not None and effect.priority < self._current.priority:
+                return False
+            self._current = effect
+            self._restart = True
+            self._cond.notify()
+            return True
+
+    def cancel(self, effect=None):
+        """取消正在播放的灯效, 传入effect时只在正在播放它时取消"""
+        with self._cond:
+            if self._current is None or (effect is not None and effect is not self._current):
+                return
+            self._current = None
+            self._restart = True
+            self._cond.notify()
+
+    @property
+    def playing(self):
+        current = self._current
+        return current.name if current is not None else None
+
+    def _apply(self, buzzer, color):
+        try:
+            self._set_buzzer(buzzer)
+            if color is not None:
+                self._set_rgb(color)
+        except Exception as e:
+            print(f"灯效输出错误: {e}")
+
+    def _next_output(self):
+        """
+        在锁内等待到下一次需要输出的时候
+        :return: 要输出的 (蜂鸣器, 颜色), 停止时返回 None
+        """
+        with self._cond:
+            while self._running:
+                now = time.monotonic()
+                if self._restart:
+                    self._restart = False
+                    if self._current is None:
+                        return 0, (0, 0, 0)
+                    self._step = 0
+                elif self._current is None:
+                    self._cond.wait()
+                    continue
+                elif now < self._step_end:
+                    self._cond.wait(self._step_end - now)
+                    continue
+                else:
+                    self._step += 1
+                    if self._step >= len(self._current.steps):
+                        self._current = None
+                        return 0, (0, 0, 0)
+                buzzer, color, duration = self._current.steps[self._step]
+                self._step_end = now + duration
+                return buzzer, color
+            return None
+
+    def _run(self):
+        # 写蜂鸣器和灯(第一次还要初始化灯带)时不持有锁, play() 不会被硬件写入阻塞
+        while True:
+            output = self._next_output()
+            if output is None:
+                break
+            self._apply(*output)
+        self._apply(0, (0, 0, 0))
@@ -1,10 +1,41 @@
 #!/usr/bin/env python3
 import pygame
 import time
+import threading
+from collections import namedtuple
+
+
+class GamepadState(namedtuple('GamepadState', 'axes buttons pressed released timestamp')):
+    """
+    手柄状态快照(不可修改)
+    axes: 各轴的值; buttons: 按住的按钮位掩码;
+    pressed/released: 从上一次快照到这一次之间按下/松开过的按钮位掩码;
+    timestamp: 最近一次收到手柄事件的时间 time.monotonic(), 用于测量输入到电机的延迟
+    """
+    __slots__ = ()
+
+    def axis(self, axis):
+        """获取指定轴的值"""
+        return self.axes[axis]
+
+    def button(self, button):
+        """按钮当前是否按住"""
+        return (self.buttons >> button) & 1
+
+    def was_pressed(self, button):
+        """按钮在这个周期内是否被按下过"""
+        return (self.pressed >> button) & 1
+
+    def was_released(self, button):
+        """按钮在这个周期内是否被松开过"""
+        return (self.released >> button) & 1
+
 
 class Gamepad:
     def __init__(self):
         """初始化手柄"""
+        self._lock = threading.Lock()
+        self.probe = None  # 耗时统计回调 probe(阶段名, 秒), 如 metrics.StageStats().record
         pygame.init()
         pygame.joystick.init()
         
@@ -22,6 +53,7 @@ class Gamepad:
             # 等待用户按下并释放两个扳机进行校准
             print("请按下并释放两个扳机（LT和RT）以校准...")
             self._calibrate_triggers()
+            self._sync()
         else:
             raise Exception("未检测到手柄设备")
 
@@ -58,22 +90,85 @@ class Gamepad:
                 status.append("等待释放RT")
             print(f"\r当前状态: {', '.join(status)}", end="")
             
-            pygame.event.pump()
-            time.sleep(0.02)
+            # 等待下一个手柄事件，不空转轮询
+            pygame.event.wait(100)
         
         print("\n校准完成！")
 
+    def _sync(self):
+        """直接从手柄读取一次全部状态, 之后只靠事件更新"""
+        pygame.event.clear()
+        self._axes = [self.joystick.get_axis(i) for i in range(self.joystick.get_numaxes())]
+        self._buttons = 0
+        for i in range(self.joystick.get_numbuttons()):
+            if self.joystick.get_button(i):
+                self._buttons |= 1 << i
+        self._pressed = 0
+        self._released = 0
+        self._event_time = time.monotonic()
+        self.state = GamepadState(tuple(self._axes), self._buttons, 0, 0, self._event_time)
+
+    def poll(self):
+        """
+        处理积压的手柄事件, 更新内部状态(不生成快照), 只能在主线程里调用
+        按下/松开的边沿会一直累积到下一次 update()
+        :return: 是否有新事件
+        """
+        probe = self.probe
+        if probe is not None:
+            start = time.perf_counter()
+        with self._lock:
+            changed = False
+            for event in pygame.event.get():
+                if event.type == pygame.JOYAXISMOTION:
+                    self._axes[event.axis] = event.value
+                elif event.type == pygame.JOYBUTTONDOWN:
+                    self._buttons |= 1 << event.button
+                    self._pressed |= 1 << event.button
+                elif event.type == pygame.JOYBUTTONUP:
+                    self._buttons &= ~(1 << event.button)
+                    self._released |= 1 << event.button
+                else:
+                    continue
+                changed = True
+            if changed:
+                self._event_time = time.monotonic()
+        if probe is not None:
+            probe('gamepad', time.perf_counter() - start)
+        return changed
+
+    def sample(self):
+        """返回当前的 (时间, 各轴的值, 按钮位掩码), 不清除边沿"""
+        with self._lock:
+            return self._event_time, tuple(self._axes), self._buttons
+
     def get_axis(self, axis):
-        """获取指定轴的值"""
-        return self.joystick.get_axis(axis)
+        """获取指定轴的值(最近一次 update() 的快照)"""
+        return self.state.axes[axis]
 
     def get_button(self, button):
-        """获取指定按钮的状态"""
-        return self.joystick.get_button(button)
+        """获取指定按钮的状态(最近一次 update() 的快照)"""
+        return self.state.button(button)
+
+    def snapshot(self):
+        """
+        用已经处理过的事件生成状态快照并清除边沿, 不处理新事件, 可以在任意线程里调用
+        :return: GamepadState
+        """
+        with self._lock:
+            self.state = GamepadState(tuple(self._axes), self._buttons,
+                                      self._pressed, self._released, self._event_time)
+            self._pressed = 0
+            self._released = 0
+        return self.state
 
     def update(self):
-        """更新手柄状态"""
-        pygame.event.pump()
+        """
+        处理手柄事件, 更新状态快照(只能在主线程里调用)
+        :return: GamepadState
+        """
+        self.poll()
+        return self.snapshot()
 
     def format_trigger_value(self, value):
         """格式化扳机值，从0%到100%"""
@@ -84,6 +179,124 @@ class Gamepad:
         """关闭手柄"""
         pygame.quit()
 
+class InputRing:
+    """固定大小的环形缓冲区, 保存 (采样时间, 各轴的值, 按钮位掩码, 事件时间) 采样"""
+    def __init__(self, capacity=512):
+        self.capacity = capacity
+        self._samples = [None] * capacity
+        self._index = 0
+        self.count = 0
+
+    def append(self, sample):
+        self._samples[self._index] = sample
+        self._index = (self._index + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def latest(self):
+        if not self.count:
+            return None
+        return self._samples[self._index - 1]
+
+    def since(self, t):
+        """返回时间不早于 t 的采样, 从新到旧"""
+        result = []
+        for i in range(1, self.count + 1):
+            sample = self._samples[self._index - i]
+            if sample[0] < t:
+                break
+            result.append(sample)
+        return result
+
+
+class GamepadSampler:
+    """
+    手柄采样线程(可选): 以较高的频率读取手柄状态, 把带时间戳的采样写入环形缓冲区
+    控制循环可以取最新采样, 或者最近 N 毫秒内的平均值/中位数/最大值/最小值,
+    这样两个控制周期之间的快速扳机动作也不会丢失
+    SDL 只能在初始化它的线程(主线程)里处理事件, 采样器不调用 poll(), 只读取主线程已经处理过的状态;
+    主线程处理事件越频繁(如 runtime 的手柄任务 500Hz), 采样越细
+    """
+    def __init__(self, gamepad, rate_hz=500, capacity=512):
+        self.gamepad = gamepad
+        self.interval = 1.0 / rate_hz
+        self.ring = InputRing(capacity)
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='gamepad', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sample(self):
+        """
+        采样一次并写入环形缓冲区(不处理手柄事件), 采样线程每个周期调用一次;
+        不启动采样线程时可以由 runtime 的手柄任务在 poll() 之后调用
+        :return: (采样时间, 各轴的值, 按钮位掩码, 最近一次手柄事件的时间)
+        """
+        now = time.monotonic()
+        event_time, axes, buttons = self.gamepad.sample()
+        sample = (now, axes, buttons, event_time)
+        with self._lock:
+            self.ring.append(sample)
+        return sample
+
+    def _run(self):
+        deadline = time.monotonic()
+        while self._running:
+            self.sample()
+            deadline += self.interval
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.monotonic()
+
+    def latest(self):
+        """
+        最新的采样
+        :return: (采样时间, 各轴的值, 按钮位掩码, 最近一次手柄事件的时间), 还没有采样时返回 None
+        """
+        with self._lock:
+            return self.ring.latest()
+
+    def filtered(self, window_ms=20, method='mean', since=None):
+        """
+        最近 window_ms 毫秒内各轴的滤波值
+        :param method: 'mean' 平均值, 'median' 中位数, 'max' 最大值, 'min' 最小值
+        :param since: 只取这个时间(time.monotonic())之后的采样, 如上一个控制周期之后
+        :return: 各轴的值, 还没有采样时返回 None
+        """
+        start = time.monotonic() - window_ms / 1000.0
+        if since is not None:
+            start = max(start, since)
+        with self._lock:
+            samples = self.ring.since(start)
+            if not samples:
+                latest = self.ring.latest()
+                return latest[1] if latest is not None else None
+        columns = list(zip(*[s[1] for s in samples]))
+        if method == 'mean':
+            return tuple(sum(c) / len(c) for c in columns)
+        if method == 'median':
+            return tuple(sorted(c)[len(c) // 2] for c in columns)
+        if method == 'max':
+            return tuple(max(c) for c in columns)
+        if method == 'min':
+            return tuple(min(c) for c in columns)
+        raise ValueError("Invalid filter method: %s" % method)
+
+
 # Xbox 360手柄按键映射
 class XboxButtons:
     A = 0
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# coding=utf8
+from sys import path
+path.append('/home/pi/MasterPi/')
+try:
+    from HiwonderSDK.Board import setPWMServosPulse
+except ImportError:  # 不在树莓派上时使用同目录下的 Board.py
+    from Board import setPWMServosPulse
+
+class Gimbal:
+    """
+    云台(水平+垂直两个舵机)
+    每个循环先用 move()/set()/center() 修改目标位置, 最后调用一次 flush()
+    把有变化的舵机合并成一帧 setPWMServosPulse 发出, 没有变化时不发送
+    """
+    def __init__(self, pan_id=6, tilt_id=5, center_pulse=1500, min_pulse=500, max_pulse=2500):
+        self.pan_id = pan_id
+        self.tilt_id = tilt_id
+        self.center_pulse = center_pulse
+        self.min_pulse = min_pulse
+        self.max_pulse = max_pulse
+        self.pan = center_pulse
+        self.tilt = center_pulse
+        # 上一次发出的位置, None表示还没发过
+        self._sent_pan = None
+        self._sent_tilt = None
+
+    def _clamp(self, pulse):
+        return max(self.min_pulse, min(self.max_pulse, pulse))
+
+    def set(self, pan=None, tilt=None):
+        """设置目标位置(脉宽)"""
+        if pan is not None:
+            self.pan = self._clamp(int(pan))
+        if tilt is not None:
+            self.tilt = self._clamp(int(tilt))
+
+    def move(self, d_pan=0, d_tilt=0):
+        """在当前目标位置上增加偏移"""
+        self.set(self.pan + d_pan, self.tilt + d_tilt)
+
+    def center(self):
+        """回中"""
+        self.set(self.center_pulse, self.center_pulse)
+
+    def flush(self, use_time=20, force=False):
+        """
+        发送本循环的目标位置
+        :param use_time: 转动时间ms
+        :param force: 为True时两个舵机都发送
+        :return: 是否发送了数据
+        """
+        args = [use_time, 0]
+        if force or self.pan != self._sent_pan:
+            args += [self.pan_id, self.pan]
+        if force or self.tilt != self._sent_tilt:
+            args += [self.tilt_id, self.tilt]
+        args[1] = (len(args) - 2) // 2
+        if args[1] == 0:
+            return False
+        setPWMServosPulse(args, force=force)
+        self._sent_pan = self.pan
+        self._sent_tilt = self.tilt
+        return True
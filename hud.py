@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# coding=utf8
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.7
+FONT_THICKNESS = 2
+TEXT_COLOR = (0, 255, 0)  # 绿色
+LINE_HEIGHT = 30
+
+class Hud:
+    """
+    预先分配的显示画面: 左边摄像头画面, 右边信息面板
+    摄像头画面直接写入显示缓冲区的视图, 固定的文字只画一次, 数值只在变化时重画
+    """
+    def __init__(self, camera_size=(640, 480), panel_width=320,
+                 crosshair=(264, 386), crosshair_size=20):
+        width, height = camera_size
+        self.display = np.zeros((height, width + panel_width, 3), dtype=np.uint8)
+        self.camera_view = self.display[:, :width]
+        self.panel = self.display[:, width:]
+        self.crosshair = crosshair
+        self.crosshair_size = crosshair_size
+        self._fields = {}
+        self._next_y = LINE_HEIGHT
+        self._frame_seq = None
+        self._disconnected = self._create_debug_frame(width, height)
+
+    @staticmethod
+    def _create_debug_frame(width, height):
+        """摄像头不可用时显示的画面"""
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        cv2.putText(frame, "Camera Disconnected", (width // 2 - 140, height // 2),
+                    FONT, 1, (0, 0, 255), 2)
+        return frame
+
+    def add_field(self, name, label):
+        """添加一行 "label: 数值", label 只画一次"""
+        y = self._next_y
+        self._next_y += LINE_HEIGHT
+        text = f"{label}: "
+        cv2.putText(self.panel, text, (10, y), FONT, FONT_SCALE, TEXT_COLOR, FONT_THICKNESS)
+        (w, h), baseline = cv2.getTextSize(text, FONT, FONT_SCALE, FONT_THICKNESS)
+        # [数值x坐标, 文字基线y, 需要清除的区域上下边界, 当前显示的数值]
+        self._fields[name] = [10 + w, y, y - h - FONT_THICKNESS, y + baseline, None]
+
+    def add_text(self, text):
+        """添加一行固定文字"""
+        cv2.putText(self.panel, text, (10, self._next_y), FONT, FONT_SCALE, TEXT_COLOR, FONT_THICKNESS)
+        self._next_y += LINE_HEIGHT
+
+    def set_field(self, name, value):
+        """更新数值, 和当前显示的一样时不重画"""
+        field = self._fields[name]
+        if value == field[4]:
+            return
+        x, y, top, bottom = field[:4]
+        self.panel[max(top, 0):bottom, x:] = 0
+        cv2.putText(self.panel, value, (x, y), FONT, FONT_SCALE, TEXT_COLOR, FONT_THICKNESS)
+        field[4] = value
+
+    def set_frame(self, seq, frame):
+        """
+        写入摄像头画面并画准心, seq 和上次相同时说明没有新帧, 不重复拷贝
+        :param frame: 为 None 时显示摄像头断开
+        """
+        if frame is None:
+            seq = -1
+            frame = self._disconnected
+        if seq == self._frame_seq:
+            return
+        self._frame_seq = seq
+        if frame.shape == self.camera_view.shape:
+            np.copyto(self.camera_view, frame)
+        else:
+            height, width = self.camera_view.shape[:2]
+            self.camera_view[:] = cv2.resize(frame, (width, height))
+
+        # 画十字准心
+        (cx, cy), size = self.crosshair, self.crosshair_size
+        cv2.line(self.camera_view, (cx - size, cy), (cx + size, cy), TEXT_COLOR, 2)  # 水平线
+        cv2.line(self.camera_view, (cx, cy - size), (cx, cy + size), TEXT_COLOR, 2)  # 垂直线
@@ -3,8 +3,124 @@
 import sys
 sys.path.append('/home/pi/MasterPi/')
 import math
+import time
 import threading
-import HiwonderSDK.Board as Board
+from collections import namedtuple
+try:
+    import HiwonderSDK.Board as Board
+except ImportError:  # 不在树莓派上时使用同目录下的 Board.py
+    import Board
+
+# cos/sin of every whole degree, used by the polar set_velocity wrapper
+_DIRECTION_TABLE = tuple((math.cos(math.radians(d)), math.sin(math.radians(d))) for d in range(360))
+
+
+def _to_polar(velocity_x, velocity_y):
+    velocity = math.sqrt(velocity_x ** 2 + velocity_y ** 2)
+    if velocity_x == 0:
+        direction = 90 if velocity_y >= 0 else 270  # pi/2 90deg, (pi * 3) / 2  270deg
+    else:
+        if velocity_y == 0:
+            direction = 0 if velocity_x > 0 else 180
+        else:
+            direction = math.atan(velocity_y / velocity_x)  # θ=arctan(y/x) (x!=0)
+            direction = direction * 180 / math.pi
+            if velocity_x < 0:
+                direction += 180
+            else:
+                if velocity_y < 0:
+                    direction += 360
+    return velocity, direction
+
+
+# max_accel: wheel speed units per second, max_jerk: units per second^2,
+# max_step: the longest dt a single update may integrate over (after a stall)
+SlewProfile = namedtuple('SlewProfile', ('max_accel', 'max_jerk', 'max_step'))
+
+PROFILES = {
+    'gentle': SlewProfile(max_accel=150.0, max_jerk=1500.0, max_step=0.05),
+    'sport': SlewProfile(max_accel=600.0, max_jerk=12000.0, max_step=0.05),
+}
+
+
+class SlewLimiter:
+    """
+    Per-wheel acceleration and jerk limiter between the kinematics and Board.setMotors
+    Every update() touches four preallocated slots and returns the same list,
+    so it costs the same on every tick whatever the rate of the control loop
+    """
+
+    def __init__(self, profile='gentle'):
+        self._output = [0.0, 0.0, 0.0, 0.0]
+        self._accel = [0.0, 0.0, 0.0, 0.0]
+        self._speeds = [0, 0, 0, 0]
+        self._last_time = None
+        # time source for dt, replay swaps in the recorded clock
+        self.clock = time.monotonic
+        self.set_profile(profile)
+
+    def set_profile(self, profile):
+        """
+        :param profile: a name in PROFILES or a SlewProfile
+        """
+        if not isinstance(profile, SlewProfile):
+            profile = PROFILES[profile]
+        self.profile = profile
+
+    def reset(self, speeds=(0, 0, 0, 0)):
+        """Jump straight to speeds, used after a hard stop"""
+        for i in range(4):
+            self._output[i] = float(speeds[i])
+            self._accel[i] = 0.0
+            self._speeds[i] = int(speeds[i])
+        self._last_time = None
+
+    def update(self, targets, dt=None):
+        """
+        Move the output towards targets by at most one tick of acceleration
+        :param targets: (v1, v2, v3, v4) requested wheel speeds
+        :param dt: seconds since the last update, measured with self.clock() when None
+        :return: the limited (v1, v2, v3, v4), a list reused by the next call
+        """
+        if dt is None:
+            now = self.clock()
+            dt = 0.0 if self._last_time is None else now - self._last_time
+            self._last_time = now
+        max_accel, max_jerk, max_step = self.profile
+        if dt > max_step:
+            dt = max_step
+        if dt <= 0:
+            return self._speeds
+        jerk_step = max_jerk * dt
+        output = self._output
+        accel = self._accel
+        speeds = self._speeds
+        for i in range(4):
+            error = targets[i] - output[i]
+            # the fastest acceleration that can still be ramped back to zero
+            # by the time the wheel reaches its target
+            limit = math.sqrt(2.0 * max_jerk * abs(error))
+            if limit > max_accel:
+                limit = max_accel
+            wanted = error / dt
+            if wanted > limit:
+                wanted = limit
+            elif wanted < -limit:
+                wanted = -limit
+            a = accel[i]
+            if wanted > a + jerk_step:
+                wanted = a + jerk_step
+            elif wanted < a - jerk_step:
+                wanted = a - jerk_step
+            value = output[i] + wanted * dt
+            if (value - targets[i]) * error >= 0:  # reached (or passed) the target
+                value = targets[i]
+                wanted = 0.0
+            output[i] = value
+            accel[i] = wanted
+            speeds[i] = int(value)
+        return speeds
+
 
 class MecanumChassis:
     # A = 67  # mm
@@ -15,18 +131,148 @@ class MecanumChassis:
         self.a = a
         self.b = b
         self.wheel_diameter = wheel_diameter
-        self.velocity = 0
-        self.direction = 0
+        self.velocity_x = 0
+        self.velocity_y = 0
         self.angular_rate = 0
+        self.limiter = None
+        # Wheel speeds of the last command sent to Board
+        self.speeds = (0, 0, 0, 0)
+        # Optional timing hook probe(stage, seconds), e.g. metrics.StageStats().record
+        self.probe = None
+        # Rows map (vx, vy, angular_rate) to v1..v4, see wheel_speeds
+        rotation = self.a + self.b
+        self.mixing_matrix = ((1, 1, rotation),
+                              (-1, 1, -rotation),
+                              (-1, 1, rotation),
+                              (1, 1, -rotation))
+
+    @property
+    def velocity(self):
+        return _to_polar(self.velocity_x, self.velocity_y)[0]
+
+    @property
+    def direction(self):
+        if self.velocity_x == 0 and self.velocity_y == 0:
+            return 0
+        return _to_polar(self.velocity_x, self.velocity_y)[1]
+
+    def set_profile(self, profile):
+        """
+        Ramp move() commands through a SlewLimiter
+        :param profile: a name in PROFILES, a SlewProfile, or None to write speeds directly
+        """
+        if profile is None:
+            self.limiter = None
+        elif self.limiter is None:
+            self.limiter = SlewLimiter(profile)
+        else:
+            self.limiter.set_profile(profile)
 
     def reset_motors(self):
-        for i in range(1, 5):
-            Board.setMotor(i, 0)
+        """Hard stop, bypasses the slew limiter"""
+        Board.setMotors([0, 0, 0, 0])
+        self.speeds = (0, 0, 0, 0)
+        if self.limiter is not None:
+            self.limiter.reset()
             
-        self.velocity = 0
-        self.direction = 0
+        self.velocity_x = 0
+        self.velocity_y = 0
         self.angular_rate = 0
 
+    def wheel_speeds(self, velocity_x, velocity_y, angular_rate):
+        """
+        Cartesian inverse kinematics, no trigonometry
+        :param velocity_x: mm/s, positive to the right (0deg)
+        :param velocity_y: mm/s, positive forward (90deg)
+        :param angular_rate: The speed at which the chassis rotates
+        :return: (v1, v2, v3, v4)
+        """
+        vp = -angular_rate * (self.a + self.b)
+        return (int(velocity_y + velocity_x - vp),
+                int(velocity_y - velocity_x + vp),
+                int(velocity_y - velocity_x - vp),
+                int(velocity_y + velocity_x + vp))
+
+    def wheel_speeds_batch(self, velocity_x, velocity_y, angular_rate):
+        """
+        NumPy form of wheel_speeds for trajectory playback and simulation
+        :param velocity_x: array (or scalar) of mm/s
+        :param velocity_y: array (or scalar) of mm/s
+        :param angular_rate: array (or scalar)
+        :return: int array of shape (N, 4), columns v1..v4
+        """
+        import numpy as np
+        commands = np.stack(np.broadcast_arrays(np.asarray(velocity_x, dtype=float),
+                                                np.asarray(velocity_y, dtype=float),
+                                                np.asarray(angular_rate, dtype=float)), axis=-1)
+        speeds = commands.reshape(-1, 3) @ np.asarray(self.mixing_matrix, dtype=float).T
+        return np.trunc(speeds).astype(int)
+
+    def set_velocity_xy(self, velocity_x, velocity_y, angular_rate, fake=False):
+        """
+        Use cartesian coordinates to control moving
+        Writes the wheels directly, bypassing the slew limiter (which then continues from these speeds)
+        :param velocity_x: mm/s, positive to the right (0deg)
+        :param velocity_y: mm/s, positive forward (90deg)
+        :param angular_rate:  The speed at which the chassis rotates
+        :param fake: only compute the wheel speeds
+        :return: (v1, v2, v3, v4)
+        """
+        probe = self.probe
+        if probe is not None:
+            start = time.perf_counter()
+        speeds = self.wheel_speeds(velocity_x, velocity_y, angular_rate)
+        if fake:
+            return speeds
+        Board.setMotors(speeds)
+        self.speeds = tuple(speeds)
+        if self.limiter is not None:
+            self.limiter.reset(speeds)  # the next move() ramps from the speeds written here
+        self.velocity_x = velocity_x
+        self.velocity_y = velocity_y
+        self.angular_rate = angular_rate
+        if probe is not None:
+            probe('chassis', time.perf_counter() - start)
+        return speeds
+
+    def move(self, velocity_x, velocity_y, angular_rate, limit=100, fake=False):
+        """
+        Holonomic command: translate and rotate at the same time
+        If any wheel would exceed ±limit, all four wheels are scaled down by the same
+        factor, so the direction of motion is kept instead of clipping single wheels
+        With a profile set (see set_profile) the wheels ramp towards the command,
+        so move(0, 0, 0) is a soft stop and reset_motors() a hard one
+        :param velocity_x: mm/s, positive to the right (0deg)
+        :param velocity_y: mm/s, positive forward (90deg)
+        :param angular_rate:  The speed at which the chassis rotates
+        :param limit: maximum wheel speed
+        :param fake: only compute the wheel speeds
+        :return: (v1, v2, v3, v4)
+        """
+        probe = self.probe
+        if probe is not None:
+            start = time.perf_counter()
+        vp = -angular_rate * (self.a + self.b)
+        v1 = velocity_y + velocity_x - vp
+        v2 = velocity_y - velocity_x + vp
+        v3 = velocity_y - velocity_x - vp
+        v4 = velocity_y + velocity_x + vp
+        peak = max(abs(v1), abs(v2), abs(v3), abs(v4))
+        scale = limit / peak if peak > limit else 1
+        speeds = (int(v1 * scale), int(v2 * scale), int(v3 * scale), int(v4 * scale))
+        if fake:
+            return speeds
+        if self.limiter is not None:
+            speeds = self.limiter.update((v1 * scale, v2 * scale, v3 * scale, v4 * scale))
+        Board.setMotors(speeds)
+        self.speeds = tuple(speeds)
+        self.velocity_x = velocity_x * scale
+        self.velocity_y = velocity_y * scale
+        self.angular_rate = angular_rate * scale
+        if probe is not None:
+            probe('chassis', time.perf_counter() - start)
+        return speeds
+
     def set_velocity(self, velocity, direction, angular_rate, fake=False):
         """
         Use polar coordinates to control moving
@@ -39,41 +285,15 @@ class MecanumChassis:
         :param fake:
         :return:
         """
-        rad_per_deg = math.pi / 180
-        vx = velocity * math.cos(direction * rad_per_deg)
-        vy = velocity * math.sin(direction * rad_per_deg)
-        vp = -angular_rate * (self.a + self.b)
-        v1 = int(vy + vx - vp) 
-        v2 = int(vy - vx + vp)
-        v3 = int(vy - vx - vp)
-        v4 = int(vy + vx + vp)
-        if fake:
-            return
-        Board.setMotor(1, v1) 
-        Board.setMotor(2, v2)
-        Board.setMotor(3, v3)
-        Board.setMotor(4, v4)
-        self.velocity = velocity
-        self.direction = direction
-        self.angular_rate = angular_rate
+        if direction == int(direction):
+            cos, sin = _DIRECTION_TABLE[int(direction) % 360]
+        else:
+            rad_per_deg = math.pi / 180
+            cos, sin = math.cos(direction * rad_per_deg), math.sin(direction * rad_per_deg)
+        return self.set_velocity_xy(velocity * cos, velocity * sin, angular_rate, fake)
 
     def translation(self, velocity_x, velocity_y, fake=False):
-        velocity = math.sqrt(velocity_x ** 2 + velocity_y ** 2)
-        if velocity_x == 0:
-            direction = 90 if velocity_y >= 0 else 270  # pi/2 90deg, (pi * 3) / 2  270deg
-        else:
-            if velocity_y == 0:
-                direction = 0 if velocity_x > 0 else 180
-            else:
-                direction = math.atan(velocity_y / velocity_x)  # θ=arctan(y/x) (x!=0)
-                direction = direction * 180 / math.pi
-                if velocity_x < 0:
-                    direction += 180
-                else:
-                    if velocity_y < 0:
-                        direction += 360
         if fake:
-            return velocity, direction
+            return _to_polar(velocity_x, velocity_y)
         else:
-            return self.set_velocity(velocity, direction, 0)
-
+            return self.set_velocity_xy(velocity_x, velocity_y, 0)
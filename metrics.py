@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# coding=utf8
+"""
+性能统计工具
+"""
+import json
+import time
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 默认的直方图桶上界(秒), 从0.1ms到1s, 5~50ms(50~200Hz的周期附近)分得更细
+DEFAULT_BOUNDS = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.003, 0.005, 0.0075,
+                  0.01, 0.0125, 0.015, 0.02, 0.025, 0.03, 0.04, 0.05, 0.075,
+                  0.1, 0.2, 0.5, 1.0)
+
+class Histogram:
+    """
+    固定桶的耗时直方图, record() 只更新计数, 开销固定
+    最后一个桶收集超过最大上界的值
+    """
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """
+        估算百分位数, 在所在的桶内线性插值
+        :param p: 0~100
+        """
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= target:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                value = lower + (upper - lower) * (target - seen) / n
+                return max(self.min, min(self.max, value))
+            seen += n
+        return self.max
+
+    def snapshot(self):
+        """返回可以直接转成JSON的统计结果"""
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.min or 0.0,
+            'max': self.max or 0.0,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'buckets': dict(zip([str(b) for b in self.bounds] + ['inf'], self.counts)),
+        }
+
+
+class _StageTimer:
+    """StageStats.time() 返回的计时器, 每个阶段一个, 重复使用"""
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+
+class StageStats:
+    """
+    按阶段统计耗时, 每个阶段一个 Histogram
+    record(stage, seconds) 可以直接作为 Board.setProbe / MecanumChassis.probe / Gamepad.probe 的回调
+    在控制线程里记录, 导出线程读取时不加锁, 快照可能差一两个计数
+    """
+    def __init__(self, bounds=DEFAULT_BOUNDS, enabled=True):
+        self.bounds = tuple(bounds)
+        self.enabled = enabled
+        self.stages = {}
+        self._timers = {}
+
+    def histogram(self, stage):
+        h = self.stages.get(stage)
+        if h is None:
+            h = self.stages[stage] = Histogram(self.bounds)
+        return h
+
+    def record(self, stage, seconds):
+        if self.enabled:
+            self.histogram(stage).record(seconds)
+
+    def time(self, stage):
+        """
+        with stats.time('servos'): ... 统计一段代码的耗时
+        没有开启时返回一个什么都不做的计时器; 同一个阶段不能嵌套或在多个线程里同时计时
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        timer = self._timers.get(stage)
+        if timer is None:
+            timer = self._timers[stage] = _StageTimer(self.histogram(stage))
+        return timer
+
+    def reset(self):
+        for h in self.stages.values():
+            h.reset()
+
+    def snapshot(self):
+        """返回各阶段的统计结果, 可以直接转成JSON"""
+        return {name: h.snapshot() for name, h in list(self.stages.items())}
+
+    def summary(self):
+        """返回每个阶段一行的统计摘要"""
+        lines = []
+        for name, h in sorted(list(self.stages.items())):
+            lines.append(f"{name:<12} n={h.count:<7} mean={h.mean * 1e6:.0f}us "
+                         f"p99={h.percentile(99) * 1e6:.0f}us max={(h.max or 0) * 1e6:.0f}us")
+        return '\n'.join(lines)
+
+
+def serve_json(snapshot, port=8900, host='127.0.0.1'):
+    """
+    在后台线程提供 HTTP/JSON 接口, GET 任意路径返回 snapshot() 的结果
+    :param snapshot: 无参数函数, 返回可以转成JSON的对象
+    :return: HTTPServer, 调用 shutdown() 停止; port=0 时用 server.server_address 查看端口
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(snapshot()).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+class Reporter:
+    """在后台线程里每隔 interval 秒输出一次 summary() 的结果, 不占用控制线程"""
+    def __init__(self, summary, interval=10.0, output=print):
+        self.summary = summary
+        self.interval = interval
+        self.output = output
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-report', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.output(self.summary())
+            except Exception as e:
+                print(f"统计输出错误: {e}")
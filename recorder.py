@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# coding=utf8
+"""
+控制周期记录和回放
+每个控制周期记录一条固定长度的二进制记录(手柄快照, 轮速, 云台舵机脉宽, 发射状态),
+文件可以直接 mmap 读取; 回放时用记录的手柄输入驱动 GamepadController, 连接模拟硬件
+用法: python3 recorder.py dump LOG
+      python3 recorder.py replay LOG [--fast]
+"""
+import mmap
+import time
+import struct
+from telemetry import LEVEL_OK, LEVEL_LOW, LEVEL_CRITICAL
+
+MAGIC = b'CARLOG'
+VERSION = 2
+MAX_AXES = 8
+# 电量等级在记录中的编号; 版本1的这个字节是填充的0, 读作 LEVEL_OK
+LEVELS = (LEVEL_OK, LEVEL_LOW, LEVEL_CRITICAL)
+
+# 文件头: 魔数, 版本, 记录长度, 轴数, 控制频率, 开始时间(time.time())
+HEADER = struct.Struct('<6sHHHfd')
+HEADER_SIZE = 32
+# 记录: 相对开始的时间(秒), 周期号, 各轴的值, 按住/按下/松开的按钮位掩码, 4个轮速, 水平/垂直舵机脉宽, 发射状态,
+#       限速用的电量等级(LEVELS 中的编号)
+RECORD = struct.Struct('<dI%ddIII4hHHBB' % MAX_AXES)
+
+class Record:
+    """一条记录"""
+    __slots__ = ('time', 'tick', 'axes', 'buttons', 'pressed', 'released', 'speeds', 'pan', 'tilt', 'fire',
+                 'level')
+
+    def __init__(self, values, num_axes=MAX_AXES):
+        self.time, self.tick = values[0], values[1]
+        self.axes = values[2:2 + num_axes]
+        i = 2 + MAX_AXES
+        self.buttons, self.pressed, self.released = values[i:i + 3]
+        self.speeds = values[i + 3:i + 7]
+        self.pan, self.tilt, self.fire = values[i + 7:i + 10]
+        self.level = LEVELS[values[i + 10]]
+
+    def outputs(self):
+        """回放时需要一致的输出: (轮速, 云台, 发射状态)"""
+        return self.speeds, self.pan, self.tilt, self.fire
+
+class Recorder:
+    """
+    控制周期记录器, record() 只打包一条记录写入文件缓冲区, 不在控制线程里刷盘
+    """
+    def __init__(self, path, num_axes=6, rate_hz=0.0):
+        if num_axes > MAX_AXES:
+            raise ValueError("Too many axes: %d" % num_axes)
+        self.path = path
+        self.num_axes = num_axes
+        self.count = 0
+        self._pad = (0.0,) * (MAX_AXES - num_axes)
+        self._file = open(path, 'wb')
+        header = HEADER.pack(MAGIC, VERSION, RECORD.size, num_axes, rate_hz, time.time())
+        self._file.write(header.ljust(HEADER_SIZE, b'\0'))
+        self._start = None
+
+    def record(self, timestamp, axes, buttons, pressed, released, speeds, pan, tilt, fire, level=LEVEL_OK):
+        """
+        :param timestamp: 本周期的时间(秒, 如 time.monotonic()), 记录的是相对第一条记录的时间
+        :param level: 本周期限速用的电量等级, 回放时用它限速
+        """
+        if self._start is None:
+            self._start = timestamp
+        self._file.write(RECORD.pack(timestamp - self._start, self.count,
+                                     *axes[:self.num_axes], *self._pad, buttons, pressed, released,
+                                     *speeds, pan, tilt, 1 if fire else 0,
+                                     LEVELS.index(level)))
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class LogReader:
+    """用 mmap 读取记录文件, 可以按下标访问或迭代"""
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self.num_axes, self.rate_hz, self.start_time = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version not in (1, VERSION) or record_size != RECORD.size:
+            raise ValueError("Invalid log file: %s" % path)
+        # 最后一条记录可能没写完(程序中途退出), 忽略
+        self.count = (len(self._map) - HEADER_SIZE) // RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return Record(RECORD.unpack_from(self._map, HEADER_SIZE + index * RECORD.size), self.num_axes)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def array(self):
+        """全部记录的 NumPy 结构化数组(不复制), 用于离线分析"""
+        import numpy as np
+        dtype = np.dtype([('time', '<f8'), ('tick', '<u4'), ('axes', '<f8', MAX_AXES),
+                          ('buttons', '<u4'), ('pressed', '<u4'), ('released', '<u4'),
+                          ('speeds', '<i2', 4), ('pan', '<u2'), ('tilt', '<u2'), ('fire', 'u1'), ('level', 'u1')])
+        return np.frombuffer(self._map, dtype=dtype, count=self.count, offset=HEADER_SIZE)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+class ReplayGamepad:
+    """
+    按记录回放的手柄, 接口和 gamepad.Gamepad 相同
+    每次 update() 取下一条记录的按钮和各轴的值(扳机是记录时控制周期实际使用的值)
+    """
+    def __init__(self, reader):
+        from gamepad import GamepadState
+        self._state_type = GamepadState
+        self.reader = reader
+        self.index = 0
+        self.probe = None
+        self.record = None
+        self.state = GamepadState((0.0,) * reader.num_axes, 0, 0, 0, time.monotonic())
+
+    def poll(self):
+        return False
+
+    def sample(self):
+        return self.state.timestamp, self.state.axes, self.state.buttons
+
+    def update(self):
+        return self.snapshot()
+
+    def snapshot(self):
+        """取下一条记录"""
+        record = self.record = self.reader[self.index]
+        self.index += 1
+        timestamp = self.state.timestamp
+        if tuple(record.axes) != self.state.axes or record.buttons != self.state.buttons:
+            timestamp = time.monotonic()
+        self.state = self._state_type(tuple(record.axes), record.buttons, record.pressed,
+                                      record.released, timestamp)
+        return self.state
+
+    def format_trigger_value(self, value):
+        return (value + 1) * 50
+
+    def close(self):
+        pass
+
+def replay(path, realtime=True, record_path=None):
+    """
+    用记录文件驱动 GamepadController, 连接模拟硬件
+    :param realtime: True 时按记录的时间回放, False 时尽快回放
+    :param record_path: 同时把回放的结果记录到这个文件
+    :return: 统计结果, mismatches 为输出(轮速, 云台, 发射状态)和记录不一致的周期数
+    """
+    import sim
+    from metrics import Histogram
+    import car_control_pygame
+
+    reader = LogReader(path)
+    gamepad = ReplayGamepad(reader)
+    # 模拟后端交给控制器, 装到底盘和舵机实际使用的 Board 模块上(树莓派上是 HiwonderSDK.Board), 不会驱动真实的电机
+    controller = car_control_pygame.GamepadController(gamepad, sim.FakeSerial(), use_sampler=False,
+                                                      record_path=record_path,
+                                                      backends=sim.backends(board=sim.SimBoard(latency=0)))
+    # 周期时间用记录的时间, 快速回放时加速度限制的结果也和记录一致
+    controller.clock = lambda: gamepad.record.time
+    tick_time = Histogram()
+    mismatches = 0
+    start = time.monotonic()
+    for record in reader:
+        if realtime:
+            delay = start + record.time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        t = time.perf_counter()
+        controller.tick(battery_level=record.level)
+        tick_time.record(time.perf_counter() - t)
+        outputs = (tuple(controller.chassis.speeds), controller.gimbal.pan, controller.gimbal.tilt,
+                   int(controller.arduino.fire))
+        if outputs != record.outputs():
+            mismatches += 1
+    elapsed = time.monotonic() - start
+    controller.close()
+    reader.close()
+    car_control_pygame.Board.init(sim.backends())
+    return {
+        'ticks': len(reader),
+        'elapsed_s': elapsed,
+        'mismatches': mismatches,
+        'tick_mean_us': tick_time.mean * 1e6,
+        'tick_p99_us': tick_time.percentile(99) * 1e6,
+    }
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="控制周期记录的查看和回放")
+    sub = parser.add_subparsers(dest='command', required=True)
+    dump = sub.add_parser('dump', help="打印记录")
+    dump.add_argument('log')
+    play = sub.add_parser('replay', help="用模拟硬件回放")
+    play.add_argument('log')
+    play.add_argument('--fast', action='store_true', help="尽快回放, 不按记录的时间")
+    play.add_argument('--record', metavar='LOG', help="把回放结果记录到文件")
+    args = parser.parse_args(argv)
+
+    if args.command == 'dump':
+        reader = LogReader(args.log)
+        print(f"{len(reader)} records, {reader.num_axes} axes, {reader.rate_hz}Hz, "
+              f"started {time.ctime(reader.start_time)}")
+        for r in reader:
+            axes = ' '.join(f"{a:+.2f}" for a in r.axes)
+            print(f"{r.time:9.3f} {r.tick:7d} [{axes}] buttons={r.buttons:#06x} "
+                  f"speeds={tuple(r.speeds)} ptz=({r.pan}, {r.tilt}) fire={r.fire} battery={r.level}")
+        reader.close()
+    else:
+        for name, value in replay(args.log, not args.fast, args.record).items():
+            print(f"{name}: {value:.1f}" if isinstance(value, float) else f"{name}: {value}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# coding=utf8
+"""
+asyncio 控制运行时: 手柄, 控制周期, 云台, Arduino 串口, 电池遥测和摄像头各是事件循环上的一个任务
+阻塞的 I/O 在执行器线程里运行: 扩展板总线一个线程(控制周期, 云台, 电池按顺序访问总线), 串口一个, 摄像头一个
+任务之间通过只保留最新值的通道 Channel 通信
+"""
+import time
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from shared import ControlState
+from telemetry import LEVEL_OK
+
+def control_state(controller):
+    """控制器本周期的状态, 发布到 'control' 通道, 多进程模式下写入共享内存"""
+    scheduler = controller.scheduler
+    return ControlState(controller.tick_time, scheduler.ticks, controller.axes, controller.chassis.speeds,
+                        controller.gimbal.pan, controller.gimbal.tilt, controller.arduino.fire,
+                        controller.arduino.connected, controller.battery.voltage,
+                        scheduler.work_time.percentile(99), scheduler.period.percentile(99), scheduler.overruns)
+
+class Channel:
+    """
+    只保留最新值的通道
+    publish() 不阻塞, 读的一方用 value 取最新值, 或者 await wait(seq) 等待比 seq 新的值; 来不及读的旧值直接丢弃
+    只能在事件循环的线程里使用
+    """
+    def __init__(self, value=None):
+        self.value = value
+        self.seq = 0
+        self._event = None  # 有任务在等待时才创建(Python 3.9 的 Event 创建时绑定事件循环)
+
+    def publish(self, value):
+        self.value = value
+        self.seq += 1
+        if self._event is not None:
+            self._event.set()
+            self._event = None
+
+    async def wait(self, seq=0):
+        """
+        :param seq: 上一次读到的序号
+        :return: (序号, 值)
+        """
+        while self.seq == seq:
+            if self._event is None:
+                self._event = asyncio.Event()
+            await self._event.wait()
+        return self.seq, self.value
+
+class Runtime:
+    """
+    在一个事件循环上运行控制器(car_control_pygame / car_control_ui 的 GamepadController)
+    通道: 'control' 每个控制周期的 ControlState, 'battery' (电压, 等级),
+          'frame' 摄像头最新帧, 断开时为 None(控制器有 camera 时)
+    pygame 只在事件循环的线程(主线程)里调用: 手柄任务处理事件, 控制任务取快照后把它交给总线线程里的 tick()
+    add_task() 可以加入其他任务, 如界面, 任务里阻塞的调用用 run_in() 放到 executor() 的线程里;
+    任一任务结束(出错或返回)或调用 stop() 后停止全部任务, 停车, 发完 Arduino 队列, 最后关闭控制器
+    """
+    def __init__(self, controller, input_hz=500):
+        self.controller = controller
+        self.scheduler = controller.scheduler
+        self.input_interval = 1.0 / input_hz
+        self.channels = {name: Channel() for name in ('control', 'battery', 'frame')}
+        self._executors = {}
+        self.bus = self.executor('bus')
+        self.serial = self.executor('serial')
+        self.video = self.executor('video')
+        self._factories = [('gamepad', self._gamepad), ('control', self._control), ('gimbal', self._gimbal),
+                           ('telemetry', self._telemetry)]
+        if getattr(controller, 'camera', None) is not None:
+            self._factories.append(('camera', self._camera))
+        self._loop = None
+        self._stop = None
+
+    def add_task(self, name, factory):
+        """
+        :param factory: factory(runtime) 返回协程, 在事件循环开始时调用
+        """
+        self._factories.append((name, lambda: factory(self)))
+
+    def stop(self):
+        """停止运行, 可以在任意线程里调用"""
+        if self._loop is None:
+            return
+        if self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def executor(self, name):
+        """
+        按名字取单线程执行器, 没有时新建, run() 结束时关闭
+        同一个执行器里的调用按顺序执行, 如界面任务把窗口和显示都放在 'ui' 执行器里
+        """
+        if name not in self._executors:
+            self._executors[name] = ThreadPoolExecutor(1, name)
+        return self._executors[name]
+
+    async def run_in(self, executor, func, *args):
+        """在执行器线程里运行阻塞的 func, 不阻塞事件循环"""
+        return await self._loop.run_in_executor(executor, func, *args)
+
+    async def _gamepad(self):
+        """
+        高频处理手柄事件, 有采样器时写入采样缓冲区(代替采样线程)
+        两次控制周期之间的按下/松开边沿留在手柄里, 由控制任务的 snapshot() 取走, 短按不会丢失
+        """
+        gamepad = self.controller.gamepad
+        sampler = self.controller.sampler
+        while True:
+            gamepad.poll()
+            if sampler is not None:
+                sampler.sample()
+            await asyncio.sleep(self.input_interval)
+
+    async def _control(self):
+        """
+        固定频率的控制周期: 在本线程取手柄快照(不处理事件), 电量等级取 'battery' 通道的最新值,
+        tick() 在总线线程里运行
+        """
+        controller = self.controller
+        gamepad = controller.gamepad
+        channel = self.channels['control']
+        battery = self.channels['battery']
+        self.scheduler.start()
+        while True:
+            state = gamepad.snapshot()
+            level = battery.value[1] if battery.value is not None else LEVEL_OK
+            await self.run_in(self.bus, controller.tick, state, level)
+            channel.publish(control_state(controller))
+            await self.scheduler.wait_async()
+
+    async def _gimbal(self):
+        """每个控制周期之后把 'control' 通道里云台的目标位置发给舵机, 没有变化时不发送"""
+        controller = self.controller
+        controller.flush_servos = False
+        channel = self.channels['control']
+
+        def flush(pan, tilt):
+            with controller.metrics.time('servos'):
+                controller.gimbal.set(pan, tilt)
+                controller.gimbal.flush(20)
+
+        seq = 0
+        while True:
+            seq, control = await channel.wait(seq)
+            await self.run_in(self.bus, flush, control.pan, control.tilt)
+
+    async def _telemetry(self):
+        """低频读取电池电压"""
+        battery = self.controller.battery
+        channel = self.channels['battery']
+        while True:
+            voltage = await self.run_in(self.bus, battery.sample)
+            if voltage is not None:
+                channel.publish((voltage, battery.level))
+            await asyncio.sleep(battery.interval)
+
+    async def _arduino(self):
+        """Arduino 串口: 发送控制周期放进队列的发射状态和心跳, stop() 之后发完队列再退出"""
+        link = self.controller.arduino
+        link.start(thread=False)
+        await self.run_in(self.serial, link.open)
+        while await self.run_in(self.serial, link.service):
+            pass
+
+    async def _camera(self):
+        """采集并解码摄像头画面, 断开(打开或读取失败)时发布 None, 界面显示摄像头断开"""
+        camera = self.controller.camera
+        channel = self.channels['frame']
+        while True:
+            frame = await self.run_in(self.video, camera.grab)
+            if frame is not None or channel.value is not None:
+                channel.publish(frame)
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        tasks = [asyncio.ensure_future(factory()) for _, factory in self._factories]
+        names = {task: name for task, (name, _) in zip(tasks, self._factories)}
+        arduino = asyncio.ensure_future(self._arduino())
+        stop = asyncio.ensure_future(self._stop.wait())
+        try:
+            done, _ = await asyncio.wait(tasks + [arduino, stop], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not stop and not task.cancelled() and task.exception() is not None:
+                    print(f"任务 {names.get(task, 'arduino')} 出错:")
+                    traceback.print_exception(type(task.exception()), task.exception(),
+                                              task.exception().__traceback__)
+        finally:
+            for task in tasks + [stop]:
+                task.cancel()
+            await asyncio.gather(*tasks, stop, return_exceptions=True)
+            # 停车后再发送停止, 等串口任务发完
+            await self.run_in(self.bus, self.controller.chassis.reset_motors)
+            self.controller.arduino.stop()
+            await asyncio.gather(arduino, return_exceptions=True)
+
+    def run(self):
+        """运行到 stop() 或 Ctrl+C, 然后打印统计并关闭控制器"""
+        start = time.monotonic()
+        try:
+            asyncio.run(self._main())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for executor in self._executors.values():
+                executor.shutdown(wait=True)
+            self._loop = None
+            controller = self.controller
+            print(f"正在退出... 运行 {time.monotonic() - start:.1f}s")
+            print(self.scheduler.summary())
+            print(f"输入到电机延迟: mean={controller.input_latency.mean * 1000:.2f}ms "
+                  f"p99={controller.input_latency.percentile(99) * 1000:.2f}ms")
+            controller.close()
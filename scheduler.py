@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# coding=utf8
+import time
+import asyncio
+from metrics import Histogram
+
+class RateScheduler:
+    """
+    固定频率的循环调度器
+    按绝对的单调时钟截止时间等待, 而不是每次固定 sleep, 所以循环内的耗时不会拉低实际频率
+    超时(本次循环超过一个周期)时计入 overruns, 并从当前时间重新对齐, 不会为了追赶而连续执行
+    """
+    def __init__(self, rate_hz=50):
+        self.set_rate(rate_hz)
+        self.work_time = Histogram()  # 每个循环的工作耗时
+        self.period = Histogram()     # 实际的循环周期
+        self.overruns = 0
+        self.ticks = 0
+        self._deadline = None
+        self._tick_start = None
+
+    def set_rate(self, rate_hz):
+        """设置循环频率, 如 50, 100, 200 Hz"""
+        if rate_hz <= 0:
+            raise ValueError("Invalid rate: %s" % rate_hz)
+        self.rate_hz = rate_hz
+        self.interval = 1.0 / rate_hz
+
+    def start(self):
+        """开始计时, 第一次 wait() 之前调用(不调用时第一次 wait() 会自动开始)"""
+        now = time.monotonic()
+        self._deadline = now + self.interval
+        self._tick_start = now
+
+    def _begin_wait(self):
+        """记录工作耗时, 返回需要等待的秒数, 超时时返回 None"""
+        now = time.monotonic()
+        self.work_time.record(now - self._tick_start)
+        if now > self._deadline:
+            self.overruns += 1
+            self._deadline = now
+            return None
+        return self._deadline - now
+
+    def _end_wait(self):
+        now = time.monotonic()
+        self.period.record(now - self._tick_start)
+        self._tick_start = now
+        self._deadline += self.interval
+        self.ticks += 1
+
+    def wait(self):
+        """
+        等待到下一个截止时间
+        :return: 本次循环是否超时
+        """
+        if self._deadline is None:
+            self.start()
+            return False
+        delay = self._begin_wait()
+        if delay is not None:
+            time.sleep(delay)
+        self._end_wait()
+        return delay is None
+
+    async def wait_async(self):
+        """和 wait() 相同, 在 asyncio 任务里使用, 等待时不阻塞事件循环"""
+        if self._deadline is None:
+            self.start()
+            return False
+        delay = self._begin_wait()
+        if delay is not None:
+            await asyncio.sleep(delay)
+        self._end_wait()
+        return delay is None
+
+    def run(self, tick, should_stop=None):
+        """
+        按固定频率循环调用 tick()
+        :param tick: 每个周期调用一次, 返回 False 时退出循环
+        :param should_stop: 可选, 返回 True 时退出循环
+        """
+        self.start()
+        while should_stop is None or not should_stop():
+            if tick() is False:
+                break
+            self.wait()
+
+    def summary(self):
+        """返回一行统计摘要"""
+        work = self.work_time
+        return (f"{self.rate_hz}Hz ticks={self.ticks} overruns={self.overruns} "
+                f"work mean={work.mean * 1000:.2f}ms p99={work.percentile(99) * 1000:.2f}ms "
+                f"max={(work.max or 0) * 1000:.2f}ms")
+
+    def stats(self):
+        """返回统计结果, 用于调参"""
+        return {
+            'rate_hz': self.rate_hz,
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'work_time': self.work_time.snapshot(),
+            'period': self.period.snapshot(),
+        }
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# coding=utf8
+"""
+进程间共享内存: 控制状态结构体和视频帧环形缓冲区, 不经过 pickle
+写的一方只有一个进程; 读的一方用序号检查读到的数据是否完整, 不完整时重读, 双方都不加锁
+"""
+import struct
+from collections import namedtuple
+from multiprocessing import shared_memory
+import numpy as np
+
+# 控制进程每个周期发布的状态
+ControlState = namedtuple('ControlState', 'timestamp tick axes speeds pan tilt fire arduino_connected '
+                                         'battery_mv work_p99 period_p99 overruns')
+
+_SEQ = struct.Struct('<Q')
+_STATE = struct.Struct('<dI6d4hHHBBHffI')
+_STATE_OFFSET = 8
+_STOP_OFFSET = _STATE_OFFSET + _STATE.size
+
+class SharedState:
+    """
+    控制状态(序号 + 固定格式的结构体) 和停止标志
+    控制进程每个周期调用 publish(), 界面进程调用 read() 取最新的状态
+    """
+    SIZE = _STOP_OFFSET + 1
+
+    def __init__(self, name=None):
+        """
+        :param name: None 时新建共享内存, 否则连接已有的(子进程中)
+        """
+        self._owner = name is None
+        if self._owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=self.SIZE)
+            self._shm.buf[:self.SIZE] = bytes(self.SIZE)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.name = self._shm.name
+        self._buf = self._shm.buf
+        self._seq = 0
+
+    def publish(self, state):
+        """写入新的状态(只能在一个进程里调用)"""
+        axes = tuple(state.axes[:6]) + (0.0,) * (6 - len(state.axes[:6]))
+        seq = self._seq
+        _SEQ.pack_into(self._buf, 0, seq + 1)  # 奇数: 正在写
+        _STATE.pack_into(self._buf, _STATE_OFFSET, state.timestamp, state.tick, *axes, *state.speeds,
+                         state.pan, state.tilt, state.fire, state.arduino_connected,
+                         int(state.battery_mv or 0), state.work_p99, state.period_p99, state.overruns)
+        self._seq = seq + 2
+        _SEQ.pack_into(self._buf, 0, self._seq)
+
+    def read(self, retries=100):
+        """
+        :return: 最新的 ControlState, 还没有发布过时返回 None
+        """
+        for _ in range(retries):
+            seq = _SEQ.unpack_from(self._buf, 0)[0]
+            if seq & 1:
+                continue
+            if seq == 0:
+                return None
+            values = _STATE.unpack_from(self._buf, _STATE_OFFSET)
+            if _SEQ.unpack_from(self._buf, 0)[0] == seq:
+                return ControlState(values[0], values[1], values[2:8], values[8:12], *values[12:])
+        return None
+
+    def request_stop(self):
+        self._buf[_STOP_OFFSET] = 1
+
+    @property
+    def stop_requested(self):
+        return bool(self._buf[_STOP_OFFSET])
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+class FrameRing:
+    """
+    视频帧环形缓冲区, 固定大小的 slots 个帧
+    头部: 最新帧的序号, 每个槽位中帧的序号; 写入时先把槽位序号清零, 拷贝完再写入序号
+    读取时拷贝后再检查槽位序号, 拷贝过程中被覆盖时重读
+    """
+    def __init__(self, shape=(480, 640, 3), slots=3, name=None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        header = 8 * (slots + 1)
+        size = header + slots * int(np.prod(self.shape))
+        self._owner = name is None
+        if self._owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.name = self._shm.name
+        self._header = np.ndarray((slots + 1,), dtype=np.uint64, buffer=self._shm.buf)
+        self._frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self._shm.buf, offset=header)
+        if self._owner:
+            self._header[:] = 0
+        self._written = int(self._header[0])
+
+    def write(self, frame):
+        """写入一帧(只能在一个进程里调用), 大小必须和 shape 相同"""
+        seq = self._written + 1
+        slot = seq % self.slots
+        self._header[1 + slot] = 0
+        np.copyto(self._frames[slot], frame)
+        self._header[1 + slot] = seq
+        self._header[0] = seq
+        self._written = seq
+
+    @property
+    def latest(self):
+        """最新帧的序号, 0 表示还没有帧"""
+        return int(self._header[0])
+
+    def read(self, out, retries=5):
+        """
+        把最新帧拷贝到 out
+        :return: 帧的序号, 没有帧或一直读不到完整的帧时返回 0
+        """
+        for _ in range(retries):
+            seq = int(self._header[0])
+            if seq == 0:
+                return 0
+            slot = seq % self.slots
+            if int(self._header[1 + slot]) != seq:
+                continue
+            np.copyto(out, self._frames[slot])
+            if int(self._header[1 + slot]) == seq:
+                return seq
+        return 0
+
+    def close(self):
+        self._header = None
+        self._frames = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+# coding=utf8
+"""
+模拟硬件, 用于在没有扩展板的普通Linux机器上测试和测速
+"""
+import time
+import threading
+from collections import deque
+
+
+class FakeI2CMsg:
+    """代替 smbus2.i2c_msg, write/read 返回可迭代的字节列表"""
+    class Msg(list):
+        def __init__(self, addr, data, read=False):
+            list.__init__(self, data)
+            self.addr = addr
+            self.read = read
+
+    @staticmethod
+    def write(addr, buf):
+        return FakeI2CMsg.Msg(addr, buf)
+
+    @staticmethod
+    def read(addr, length):
+        return FakeI2CMsg.Msg(addr, [0] * length, read=True)
+
+
+class SimBoard:
+    """
+    模拟的扩展板, 实现和 Board.I2CBackend 相同的 write/read/close 接口
+    保存寄存器状态: 电机 31~34(有符号), PWM舵机命令 40(解析成各舵机的脉宽), 电池ADC 0(毫伏)
+    latency 为每次读写的模拟耗时(秒), 用于比较不同的总线访问方式
+    """
+    ADC_BAT_ADDR = 0
+    MOTOR_ADDR = 31
+    SERVO_ADDR_CMD = 40
+
+    def __init__(self, latency=0.0001, battery_mv=7400):
+        self.latency = latency
+        self.battery_mv = battery_mv
+        self.registers = bytearray(256)
+        self.motors = [0, 0, 0, 0]
+        self.servo_pulses = [0, 0, 0, 0, 0, 0]
+        self.servo_times = [0, 0, 0, 0, 0, 0]
+        self.writes = 0
+        self.reads = 0
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+    @property
+    def transactions(self):
+        return self.writes + self.reads
+
+    def reset_stats(self):
+        self.writes = 0
+        self.reads = 0
+        self.bytes_written = 0
+
+    def write(self, reg, data):
+        if self.latency:
+            time.sleep(self.latency)
+        data = list(data)
+        with self._lock:
+            self.writes += 1
+            self.bytes_written += len(data) + 1
+            if reg == self.SERVO_ADDR_CMD:
+                # 舵机数量, 时间(2字节), 然后每个舵机: id, 脉宽(2字节)
+                number = data[0]
+                use_time = data[1] | (data[2] << 8)
+                for i in range(number):
+                    servo_id, low, high = data[3 + i * 3:6 + i * 3]
+                    self.servo_pulses[servo_id - 1] = low | (high << 8)
+                    self.servo_times[servo_id - 1] = use_time
+                return
+            self.registers[reg:reg + len(data)] = bytes(data)
+            for i in range(4):
+                self.motors[i] = int.from_bytes(self.registers[self.MOTOR_ADDR + i:self.MOTOR_ADDR + i + 1],
+                                                'little', signed=True)
+
+    def read(self, reg, length):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.reads += 1
+            self.registers[self.ADC_BAT_ADDR:self.ADC_BAT_ADDR + 2] = int(self.battery_mv).to_bytes(2, 'little')
+            return bytes(self.registers[reg:reg + length])
+
+    def close(self):
+        pass
+
+
+class FakeSMBus:
+    """
+    假的I2C总线, 接口与 smbus2.SMBus 一致(i2c_rdwr/close/with), 配合 FakeI2CMsg 使用
+    open_latency 模拟打开 /dev/i2c-1 的开销, xfer_latency 模拟每次传输的开销
+    给出 board(SimBoard) 时, 写入的寄存器和读出的数据都经过 board
+    """
+    opened = 0
+
+    def __init__(self, bus=1, open_latency=0.0002, xfer_latency=0.0001, board=None):
+        self.bus = bus
+        self.xfer_latency = xfer_latency
+        self.board = board
+        self.transactions = 0
+        self.log = deque(maxlen=1000)
+        self._pointer = 0
+        self._lock = threading.Lock()
+        if open_latency:
+            time.sleep(open_latency)
+        FakeSMBus.opened += 1
+
+    def i2c_rdwr(self, *msgs):
+        with self._lock:
+            if self.xfer_latency:
+                time.sleep(self.xfer_latency)
+            for msg in msgs:
+                if self.board is not None:
+                    if getattr(msg, 'read', False):
+                        msg[:] = self.board.read(self._pointer, len(msg))
+                    elif len(msg):
+                        self._pointer = msg[0]
+                        if len(msg) > 1:
+                            self.board.write(msg[0], msg[1:])
+                self.log.append(bytes(list(msg)))
+            self.transactions += 1
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FakeGPIO:
+    """代替 RPi.GPIO, 记录每个引脚的输出"""
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+
+    def __init__(self):
+        self.mode = None
+        self.pins = {}
+        self.outputs = 0
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction, *args, **kwargs):
+        self.pins.setdefault(pin, 0)
+
+    def output(self, pin, state):
+        self.pins[pin] = int(state)
+        self.outputs += 1
+
+    def input(self, pin):
+        return self.pins.get(pin, 0)
+
+
+class FakePixelStrip:
+    """代替 rpi_ws281x.PixelStrip"""
+    def __init__(self, num, pin, *args):
+        self.pixels = [0] * num
+        self.shows = 0
+
+    def begin(self):
+        pass
+
+    def numPixels(self):
+        return len(self.pixels)
+
+    def setPixelColor(self, n, color):
+        self.pixels[n] = color
+
+    def show(self):
+        self.shows += 1
+
+
+def fake_color(red, green, blue, white=0):
+    """代替 rpi_ws281x.Color"""
+    return (white << 24) | (red << 16) | (green << 8) | blue
+
+
+class FakeDeviation:
+    """代替 yaml_handle, 舵机偏差全部为0"""
+    Deviation_file_path = ''
+
+    @staticmethod
+    def get_yaml_data(path):
+        return {str(i): 0 for i in range(1, 7)}
+
+
+class ScriptedGamepad:
+    """
+    按脚本回放的手柄, 接口和 gamepad.Gamepad 相同, 用于在没有手柄时运行控制器的 tick()
+    script: [(各轴的值, 按钮位掩码), ...], 每次 update() 取下一项, 到末尾后从头循环
+    """
+    def __init__(self, script):
+        from gamepad import GamepadState
+        self._state_type = GamepadState
+        self.script = list(script)
+        self.probe = None
+        self._index = 0
+        # 开始时没有按钮按下, 脚本第一项里按下的按钮也会产生按下的边沿
+        self._axes = tuple(self.script[0][0])
+        self._buttons = 0
+        self._event_time = time.monotonic()
+        self.state = GamepadState(self._axes, 0, 0, 0, self._event_time)
+
+    def poll(self):
+        axes, buttons = self.script[self._index % len(self.script)]
+        changed = tuple(axes) != self._axes or buttons != self._buttons
+        if changed:
+            self._event_time = time.monotonic()
+        return changed
+
+    def sample(self):
+        return self._event_time, self._axes, self._buttons
+
+    def update(self):
+        self.poll()
+        return self.snapshot()
+
+    def snapshot(self):
+        """取脚本的下一项"""
+        axes, buttons = self.script[self._index % len(self.script)]
+        self._index += 1
+        previous = self._buttons
+        self._axes = tuple(axes)
+        self._buttons = buttons
+        self.state = self._state_type(self._axes, buttons, buttons & ~previous,
+                                      previous & ~buttons, self._event_time)
+        return self.state
+
+    def format_trigger_value(self, value):
+        return (value + 1) * 50
+
+    def close(self):
+        pass
+
+
+class FakeSerial:
+    """代替 serial.Serial, 只记录写入的数据"""
+    def __init__(self, port='sim', baudrate=115200, timeout=None):
+        self.port = port
+        self.written = []
+        self.bytes_written = 0
+        self.is_open = True
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        self.bytes_written += len(data)
+        return len(data)
+
+    def close(self):
+        self.is_open = False
+
+
+class SimServoSerial:
+    """
+    模拟的总线舵机串口(LOBOT协议), 接口和 serial.Serial 相同, 用于测试 busservo.BusServoBus
+    按波特率计算每帧的传输时间, 舵机收到读命令 reply_delay 秒后开始回复, 总线同一时间只传一帧
+    drop_rate: 随机丢弃回复的比例, 用于测试超时重试
+    """
+    def __init__(self, port='sim', baudrate=115200, timeout=0.002, servo_ids=(1, 2, 3, 4, 5, 6),
+                 reply_delay=0.0005, drop_rate=0.0, seed=0):
+        import random
+        import busservo
+        self._proto = busservo
+        self._parser = busservo.FrameParser()
+        self._random = random.Random(seed)
+        self.port = port
+        self.timeout = timeout
+        self.byte_time = 10.0 / baudrate
+        self.reply_delay = reply_delay
+        self.drop_rate = drop_rate
+        self.servos = {i: self.new_servo(i) for i in servo_ids}
+        self.requests = 0
+        self.dropped = 0
+        self.is_open = True
+        self._rx = deque()  # (可以读取的时间, 字节)
+        self._bus_free = 0.0
+
+    @staticmethod
+    def new_servo(servo_id):
+        return {'id': servo_id, 'pulse': 500, 'temp': 35, 'vin': 7400, 'deviation': 0,
+                'angle_limit': (0, 1000), 'vin_limit': (4500, 12000), 'temp_limit': 85, 'load': 1}
+
+    def _transmit(self, length, start=None):
+        """占用总线传输 length 个字节, 返回传输结束的时间"""
+        start = max(time.monotonic() if start is None else start, self._bus_free)
+        self._bus_free = start + length * self.byte_time
+        return self._bus_free
+
+    def write(self, data):
+        end = self._transmit(len(data))
+        for servo_id, cmd, params in self._parser.feed(data):
+            self._handle(servo_id, cmd, params, end)
+        return len(data)
+
+    def _handle(self, servo_id, cmd, params, end):
+        p = self._proto
+        if servo_id == p.BROADCAST_ID:
+            targets = list(self.servos.values())
+        else:
+            targets = [self.servos[servo_id]] if servo_id in self.servos else []
+        value = lambda i: params[i] | (params[i + 1] << 8)
+        for servo in targets:
+            if cmd == p.LOBOT_SERVO_MOVE_TIME_WRITE:
+                servo['pulse'] = value(0)
+            elif cmd == p.LOBOT_SERVO_ID_WRITE:
+                del self.servos[servo['id']]
+                servo['id'] = params[0]
+                self.servos[params[0]] = servo
+            elif cmd == p.LOBOT_SERVO_ANGLE_OFFSET_ADJUST:
+                servo['deviation'] = params[0] - 256 if params[0] > 127 else params[0]
+            elif cmd == p.LOBOT_SERVO_ANGLE_LIMIT_WRITE:
+                servo['angle_limit'] = (value(0), value(2))
+            elif cmd == p.LOBOT_SERVO_VIN_LIMIT_WRITE:
+                servo['vin_limit'] = (value(0), value(2))
+            elif cmd == p.LOBOT_SERVO_TEMP_MAX_LIMIT_WRITE:
+                servo['temp_limit'] = params[0]
+            elif cmd == p.LOBOT_SERVO_LOAD_OR_UNLOAD_WRITE:
+                servo['load'] = params[0]
+            else:
+                names = [name for name, read_cmd in p.PROPERTIES.items() if read_cmd == cmd]
+                if not names:
+                    continue
+                self.requests += 1
+                if self.drop_rate and self._random.random() < self.drop_rate:
+                    self.dropped += 1
+                    continue
+                reply = servo[names[0]]
+                if isinstance(reply, tuple):
+                    frame = p.encode(servo['id'], cmd, reply[0], reply[0] >> 8, reply[1], reply[1] >> 8)
+                elif cmd in (p.LOBOT_SERVO_POS_READ, p.LOBOT_SERVO_VIN_READ):
+                    frame = p.encode(servo['id'], cmd, reply, reply >> 8)
+                else:
+                    frame = p.encode(servo['id'], cmd, reply)
+                ready = self._transmit(len(frame), end + self.reply_delay)
+                self._rx.append((ready, frame))
+
+    @property
+    def in_waiting(self):
+        now = time.monotonic()
+        return sum(len(frame) for ready, frame in self._rx if ready <= now)
+
+    def read(self, size=1):
+        deadline = time.monotonic() + (self.timeout or 0)
+        data = bytearray()
+        while len(data) < size:
+            now = time.monotonic()
+            if self._rx and self._rx[0][0] <= now:
+                ready, frame = self._rx.popleft()
+                need = size - len(data)
+                if len(frame) > need:  # 没读完的部分留到下次
+                    self._rx.appendleft((ready, frame[need:]))
+                data += frame[:need]
+                continue
+            if data or now >= deadline:
+                break
+            wait = deadline - now
+            if self._rx:
+                wait = min(wait, self._rx[0][0] - now)
+            time.sleep(max(wait, 0))
+        return bytes(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        now = time.monotonic()
+        while self._rx and self._rx[0][0] <= now:
+            self._rx.popleft()
+
+    def close(self):
+        self.is_open = False
+
+
+class PtyArduino:
+    """
+    用伪终端模拟的 Arduino, path 可以像真实串口一样用 serial.Serial(path) 打开
+    记录收到的每一行 (时间, 内容), ack=True 时每收到一行回复 b'ok\n'
+    """
+    def __init__(self, ack=False, reply_delay=0.0):
+        self.ack = ack
+        self.reply_delay = reply_delay
+        self.lines = []
+        self.path = None
+        self._thread = None
+        self.plug()
+
+    def plug(self):
+        """插上设备, 每次插上都是一个新的路径(像 ttyACM0 变成 ttyACM1)"""
+        import os
+        import tty
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.path = os.ttyname(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='pty-arduino', daemon=True)
+        self._thread.start()
+
+    def unplug(self):
+        """拔掉设备, 已经打开的串口再写入时会出错"""
+        import os
+        if self._thread is None:
+            return
+        self._running = False
+        self._thread.join()
+        self._thread = None
+        os.close(self._master)
+        os.close(self._slave)
+        self.path = None
+
+    def _run(self):
+        import os
+        import select
+        buf = b''
+        while self._running:
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 1024)
+            except OSError:
+                break
+            buf += data
+            while b'\n' in buf:
+                line, buf = buf.split(b'\n', 1)
+                self.lines.append((time.monotonic(), line))
+                if self.ack:
+                    if self.reply_delay:
+                        time.sleep(self.reply_delay)
+                    os.write(self._master, b'ok\n')
+
+    def received(self):
+        """收到的各行内容"""
+        return [line for _, line in self.lines]
+
+    def close(self):
+        self.unplug()
+
+
+def backends(**overrides):
+    """
+    Board.init() 使用的模拟后端, 不需要任何树莓派相关的库
+    例: board = SimBoard(latency=0.0005); Board.init(sim.backends(board=board))
+    """
+    result = {
+        'board': SimBoard(),
+        'i2c': FakeSMBus,
+        'i2c_msg': FakeI2CMsg,
+        'gpio': FakeGPIO(),
+        'rgb': FakePixelStrip,
+        'color': fake_color,
+        'yaml': FakeDeviation,
+        'servo_serial': SimServoSerial,
+    }
+    result.update(overrides)
+    return result
+
+
+class MJPEGServer:
+    """
+    本地的MJPEG视频流服务器, 代替 mjpg-streamer (http://127.0.0.1:8080?action=stream)
+    fps 控制发帧速度, 用于测量摄像头对控制循环的影响
+    """
+    def __init__(self, port=0, fps=30, size=(640, 480)):
+        import cv2
+        import numpy as np
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+        frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        cv2.putText(frame, "MJPEG test stream", (40, size[1] // 2),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        jpeg = cv2.imencode('.jpg', frame)[1].tobytes()
+        interval = 1.0 / fps
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+                self.end_headers()
+                try:
+                    while server._running:
+                        self.wfile.write(b'--frame\r\nContent-Type: image/jpeg\r\n')
+                        self.wfile.write(b'Content-Length: %d\r\n\r\n' % len(jpeg))
+                        self.wfile.write(jpeg + b'\r\n')
+                        time.sleep(interval)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self._running = True
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self.url = f'http://127.0.0.1:{self.port}/?action=stream'
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._running = False
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# coding=utf8
+"""
+电池电压遥测, 在后台线程里低频读取ADC, 控制循环和界面只读缓存的值, 不访问总线
+"""
+import time
+import threading
+from collections import deque
+from sys import path
+path.append('/home/pi/MasterPi/')
+try:
+    import HiwonderSDK.Board as Board
+except ImportError:  # 不在树莓派上时使用同目录下的 Board.py
+    import Board
+
+# 电量等级
+LEVEL_OK = 'ok'
+LEVEL_LOW = 'low'
+LEVEL_CRITICAL = 'critical'
+
+# 各等级下的限速比例
+SPEED_SCALE = {LEVEL_OK: 1.0, LEVEL_LOW: 0.6, LEVEL_CRITICAL: 0.3}
+
+class BatteryMonitor:
+    """
+    电池电压监视线程
+    按 rate_hz 读取 Board.getBattery()(毫伏), 指数平滑后缓存; history() 返回最近的读数
+    平滑后的电压低于 low_mv / critical_mv 时进入 low / critical, 高出 hysteresis_mv 后才恢复,
+    等级变化时在监视线程里调用 on_event(等级, 电压)
+    """
+    def __init__(self, read_battery=None, rate_hz=2.0, smoothing=0.3, history=600,
+                 low_mv=6800, critical_mv=6400, hysteresis_mv=100, on_event=None):
+        self.read_battery = read_battery if read_battery is not None else Board.getBattery
+        self.interval = 1.0 / rate_hz
+        self.smoothing = smoothing
+        self.low_mv = low_mv
+        self.critical_mv = critical_mv
+        self.hysteresis_mv = hysteresis_mv
+        self.on_event = on_event
+        self.voltage = None     # 平滑后的电压(毫伏), 还没有读数时为None
+        self.raw = None         # 最近一次读数
+        self.level = LEVEL_OK
+        self.samples = 0
+        self.errors = 0
+        self.last_error = None
+        self._history = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='battery', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def history(self):
+        """最近的读数 [(time.monotonic(), 原始电压, 平滑后的电压), ...]"""
+        with self._lock:
+            return list(self._history)
+
+    def speed_scale(self):
+        """当前电量等级下的限速比例"""
+        return SPEED_SCALE[self.level]
+
+    def sample(self):
+        """读取一次并更新缓存, 监视线程每个周期调用一次, 也可以直接调用"""
+        try:
+            raw = self.read_battery()
+        except Exception as e:
+            self.errors += 1
+            if str(e) != self.last_error:
+                print(f"电池电压读取错误: {e}")
+            self.last_error = str(e)
+            return None
+        voltage = raw if self.voltage is None else self.voltage + self.smoothing * (raw - self.voltage)
+        with self._lock:
+            self._history.append((time.monotonic(), raw, voltage))
+            self.raw = raw
+            self.voltage = voltage
+            self.samples += 1
+        self._update_level(voltage)
+        return voltage
+
+    def _update_level(self, voltage):
+        level = self.level
+        if voltage < self.critical_mv:
+            level = LEVEL_CRITICAL
+        elif voltage < self.low_mv:
+            if level != LEVEL_CRITICAL or voltage > self.critical_mv + self.hysteresis_mv:
+                level = LEVEL_LOW
+        elif voltage > self.low_mv + self.hysteresis_mv:
+            level = LEVEL_OK
+        elif level == LEVEL_CRITICAL:
+            level = LEVEL_LOW
+        if level != self.level:
+            self.level = level
+            if self.on_event is not None:
+                try:
+                    self.on_event(level, voltage)
+                except Exception as e:
+                    print(f"电池事件处理错误: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)